@@ -2,12 +2,14 @@
 import streamlit as st
 import pandas as pd
 import main
+from insight_extraction.utils.run_manifest import new_run_id
 
 # ============================
 # Placeholder: your LLM logic
 # ============================
 def get_chart_recommendations(user_query: str, df: pd.DataFrame) -> str:
-    main.main(user_prompt=user_query, df=df, run_id=0)  # You can modify this to pass the DataFrame directly
+    # unique per request: concurrent sessions never share a run directory
+    main.main(user_prompt=user_query, df=df, run_id=new_run_id())
     return ()
 
 
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.bench_assignment_json import make_inputs
+from insight_extraction.categorizer.categorize import build_allocation
+from insight_extraction.categorizer.my_io.save_json import save_allocation
+from insight_extraction.extraction.table_creator import (
+    build_analytics_dataframe,
+    load_assignments,
+)
+
+
+def main(n_rows: int = 1_000_000) -> None:
+    rng = np.random.default_rng(0)
+    df, all_best_idx, dim2cat_embs = make_inputs(n_rows, rng)
+    allocation = build_allocation(df, all_best_idx, dim2cat_embs)
+    print(f"🔍 {n_rows} rows, {len(all_best_idx)} dimensions\n")
+    print(f"{'format':<10}{'write [s]':>12}{'read [s]':>12}{'read+table [s]':>16}{'size [MB]':>12}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for suffix in (".json", ".parquet", ".arrow"):
+            path = Path(tmp) / f"allocation{suffix}"
+
+            t0 = time.perf_counter()
+            save_allocation(allocation, str(path))
+            t_write = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            loaded = load_assignments(path)
+            t_read = time.perf_counter() - t0
+            build_analytics_dataframe(loaded)
+            t_table = time.perf_counter() - t0
+
+            size_mb = os.path.getsize(path) / 1e6
+            print(f"{suffix[1:]:<10}{t_write:>12.2f}{t_read:>12.2f}{t_table:>16.2f}{size_mb:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
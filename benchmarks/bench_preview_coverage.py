@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import contextlib
+import io
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from insight_extraction.categorizer.allocation import CategoryAllocation
+from insight_extraction.categorizer.sampling import stratified_sample
+from insight_extraction.extraction.preview import scale_preview_results
+from insight_extraction.extraction.sql_compiler import compile_intent_to_sql
+from insight_extraction.extraction.sql_execute import execute_sql_on_sqlite
+from insight_extraction.extraction.table_creator import (
+    build_analytics_dataframe,
+    open_memory_db,
+    save_dataframe_to_sqlite,
+)
+
+INTENT = {
+    "metrics": ["count_events", "proportion_events", "trend_over_time"],
+    "time": {"year": 2024, "month": 12},
+    "group_by": [
+        {"dimension_type": "LOCATION"},
+        {"dimension_type": "OBSERVATION_TYPE"},
+    ],
+    "filters": [],
+}
+KEYS = ("location", "observation_type", "event_year", "event_month")
+
+
+def make_allocation(n_rows: int, rng: np.random.Generator) -> CategoryAllocation:
+    obs = np.datetime64("2023-01-01") + rng.integers(0, 730, n_rows).astype("timedelta64[D]")
+    obs = obs.astype("datetime64[us]")
+    obs[:50] = np.datetime64("NaT")
+    proc = obs + rng.integers(0, 30, n_rows).astype("timedelta64[D]")
+    locations = np.array(["office", "plant", "yard", None], dtype=object)
+    types = np.array(["near_miss", "hazard", "incident"], dtype=object)
+    return CategoryAllocation(
+        row_index=np.arange(n_rows),
+        observation_date=obs,
+        processed_date=proc,
+        assignments={
+            "LOCATION": rng.choice(locations, n_rows, p=[0.5, 0.3, 0.15, 0.05]),
+            "OBSERVATION_TYPE": rng.choice(types, n_rows, p=[0.6, 0.35, 0.05]),
+        },
+    )
+
+
+def subset(allocation: CategoryAllocation, positions: np.ndarray) -> CategoryAllocation:
+    return CategoryAllocation(
+        row_index=positions,
+        observation_date=allocation.observation_date[positions],
+        processed_date=allocation.processed_date[positions],
+        assignments={dim: cats[positions] for dim, cats in allocation.assignments.items()},
+    )
+
+
+def run_queries(table: pd.DataFrame, sql: str, name: str):
+    conn = open_memory_db(name)
+    # the executor logs every query; only the frames are of interest here
+    with contextlib.redirect_stdout(io.StringIO()):
+        save_dataframe_to_sqlite(table, None, conn=conn)
+        results = execute_sql_on_sqlite(None, sql, conn=conn)
+    conn.close()
+    return results
+
+
+def main(
+    n_rows: int = 200_000,
+    fraction: float = 0.1,
+    n_samples: int = 40,
+    confidence: float = 0.95,
+) -> None:
+    """
+    Empirical coverage of the preview confidence intervals: the share of
+    estimates whose interval contains the value computed on all rows,
+    over n_samples stratified samples (expected close to `confidence`).
+    """
+    allocation = make_allocation(n_rows, np.random.default_rng(1))
+    table = build_analytics_dataframe(allocation)
+    sql = compile_intent_to_sql(INTENT, table.columns.tolist())
+    truth = run_queries(table, sql, "bench_preview_truth")
+    dates = pd.DataFrame({"d": allocation.observation_date})
+
+    covered: Dict[str, int] = {}
+    total: Dict[str, int] = {}
+    for seed in range(n_samples):
+        positions, design = stratified_sample(dates, "d", fraction, random_state=seed)
+        sample = build_analytics_dataframe(subset(allocation, positions))
+        results = scale_preview_results(
+            run_queries(sample, sql, f"bench_preview_{seed}"), design, confidence
+        )
+        for key, payload in results.items():
+            frame, true_frame = payload["frame"], truth[key]["frame"]
+            keys = [c for c in true_frame.columns if c in KEYS]
+            merged = frame.merge(true_frame, on=keys, suffixes=("", "_true"))
+            for col in (c[: -len("_estimate")] for c in frame.columns if c.endswith("_estimate")):
+                inside = (merged[f"{col}_ci_low"] <= merged[f"{col}_true"]) & (
+                    merged[f"{col}_true"] <= merged[f"{col}_ci_high"]
+                )
+                covered[col] = covered.get(col, 0) + int(inside.sum())
+                total[col] = total.get(col, 0) + len(inside)
+
+    print(f"🔍 {n_rows} rows, {n_samples} samples of {fraction:.0%}, level {confidence:.0%}\n")
+    print(f"{'column':<22}{'intervals':>10}{'coverage':>10}")
+    for col in total:
+        print(f"{col:<22}{total[col]:>10}{covered[col] / total[col]:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
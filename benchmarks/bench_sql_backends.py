@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import contextlib
+import io
+import time
+
+import numpy as np
+
+from benchmarks.bench_assignment_json import make_inputs
+from insight_extraction.categorizer.categorize import build_allocation
+from insight_extraction.extraction.duckdb_execute import execute_sql_on_duckdb, open_duckdb
+from insight_extraction.extraction.sql_compiler import compile_intent_to_sql
+from insight_extraction.extraction.sql_execute import execute_sql_on_sqlite
+from insight_extraction.extraction.table_creator import (
+    build_analytics_dataframe,
+    open_memory_db,
+    save_dataframe_to_sqlite,
+)
+
+INTENT = {
+    "metrics": ["count_events", "proportion_events", "avg_processing_time", "trend_over_time"],
+    "time": {"from": "2023-03-01", "to": "2024-08-31"},
+    "group_by": [
+        {"dimension_type": "LOCATION"},
+        {"dimension_type": "OBSERVATION_TYPE"},
+        {"dimension_type": "DEPARTMENT"},
+    ],
+    "filters": [],
+}
+
+
+def _timed(fn, *args, **kwargs):
+    # the executors log every query; only the timing is of interest here
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        out = fn(*args, **kwargs)
+    return time.perf_counter() - t0, out
+
+
+def main(n_rows: int = 2_000_000) -> None:
+    rng = np.random.default_rng(0)
+    df, all_best_idx, dim2cat_embs = make_inputs(n_rows, rng)
+    table = build_analytics_dataframe(build_allocation(df, all_best_idx, dim2cat_embs))
+
+    # from / to window: the queries scan the full table, not the rollup
+    sql = compile_intent_to_sql(INTENT, table.columns.tolist())
+    print(f"🔍 {n_rows} rows, {sql.count('-- ')} labelled queries\n")
+
+    conn = open_memory_db("bench_sql_backends")
+    t_load_sqlite, _ = _timed(save_dataframe_to_sqlite, table, None, conn=conn)
+    t_load_duckdb, duck = _timed(open_duckdb, table)
+
+    t_sqlite, sqlite_results = _timed(execute_sql_on_sqlite, None, sql, conn=conn)
+    t_duckdb, duckdb_results = _timed(execute_sql_on_duckdb, duck, sql)
+
+    same = all(
+        sqlite_results[k]["frame"].astype(object).equals(duckdb_results[k]["frame"].astype(object))
+        for k in sqlite_results
+    ) and list(sqlite_results) == list(duckdb_results)
+
+    print(f"{'backend':<10}{'load [s]':>12}{'queries [s]':>14}")
+    print(f"{'sqlite':<10}{t_load_sqlite:>12.2f}{t_sqlite:>14.2f}")
+    print(f"{'duckdb':<10}{t_load_duckdb:>12.2f}{t_duckdb:>14.2f}  (x{t_sqlite / t_duckdb:.1f})")
+    print(f"same results: {same}")
+
+    conn.close()
+    duck.close()
+
+
+if __name__ == "__main__":
+    main()
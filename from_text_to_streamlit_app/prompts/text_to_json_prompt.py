@@ -4,16 +4,23 @@ from from_text_to_streamlit_app.available_streamlit_components import SAFE_STREA
 from from_text_to_streamlit_app.utils import *
 
 
-def get_text_to_json_prompt(datasets, rec_dir):
+def get_text_to_json_prompt(datasets, rec_dir, rec_paths=None):
+        '''
+        rec_paths: recommendation files to use (e.g. from the run manifest);
+        when None, every .txt file in rec_dir.
+        '''
 
         dataset_dicts = {name: df.to_dict(orient="records") for name, df in datasets.items()}
         
+        if rec_paths is None:
+            rec_paths = [
+                os.path.join(rec_dir, file) for file in os.listdir(rec_dir) if file.endswith(".txt")
+            ]
+
         txt_dict = {}
-        for file in os.listdir(rec_dir):
-            if file.endswith(".txt"):
-                recommendation_path = os.path.join(rec_dir, file)
-                best_visual = extract_best_visualization(recommendation_path)
-                txt_dict[file.split(".")[0]] = best_visual
+        for recommendation_path in rec_paths:
+            best_visual = extract_best_visualization(recommendation_path)
+            txt_dict[os.path.basename(recommendation_path).split(".")[0]] = best_visual
         
 
         print("Building the prompt for the given recommendation ...")
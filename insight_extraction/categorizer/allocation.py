@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+
+import threading
+import numpy as np
+import pandas as pd
+
+
+def format_iso_dates(values: Any) -> np.ndarray:
+    """
+    Vectorized equivalent of `ts.isoformat() if pd.notnull(ts) else None`
+    for a whole column (microseconds only where they are non-zero).
+
+    Only the distinct timestamps are formatted (dates repeat a lot), then
+    mapped back through their codes; NaT maps to None.
+    """
+    arr = pd.to_datetime(values, errors="coerce")
+    arr = np.asarray(arr, dtype="datetime64[us]")
+    codes, uniques = pd.factorize(arr)
+    uniques = np.asarray(uniques, dtype="datetime64[us]")
+
+    formatted = np.datetime_as_string(uniques, unit="s").astype(object)
+    frac = uniques.astype(np.int64) % 1_000_000 != 0
+    if frac.any():
+        formatted[frac] = np.datetime_as_string(uniques[frac], unit="us").astype(object)
+
+    # code -1 (NaT) picks the trailing None
+    lookup = np.append(formatted, None)
+    return lookup[codes]
+
+
+@dataclass
+class CategoryAllocation:
+    """
+    Columnar category allocation produced by run_pipeline.
+
+    row_index : int array, one entry per observation.
+    observation_date, processed_date : datetime64 arrays (NaT if missing).
+    assignments : dimension_type -> object array of category names
+        (None when the row has no category for that dimension).
+    observation_id : optional stable ids (incremental pipeline).
+    text_hash : optional hash of each observation text, and
+    assignment_scores : optional dimension_type -> float array of match
+        scores (NaN without a category); both kept by the incremental
+        pipeline to detect changed rows and update its stats.
+    sample_design : sampling.SampleDesign when the allocation covers a
+        stratified sample of the observations (preview mode), else None.
+    """
+    row_index: np.ndarray
+    observation_date: np.ndarray
+    processed_date: np.ndarray
+    assignments: Dict[str, np.ndarray]
+    observation_id: Optional[np.ndarray] = None
+    text_hash: Optional[np.ndarray] = None
+    assignment_scores: Optional[Dict[str, np.ndarray]] = None
+    sample_design: Optional[Any] = None
+    pending_writes: List[threading.Thread] = field(default_factory=list, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.row_index)
+
+    def wait_for_persistence(self) -> None:
+        """
+        Block until the background writes started for this allocation end.
+        """
+        for thread in self.pending_writes:
+            thread.join()
+        self.pending_writes.clear()
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """
+        JSON-serializable records (format of allocation_{run_id}.json).
+        """
+        dims = list(self.assignments.keys())
+        obs_dates = format_iso_dates(self.observation_date)
+        proc_dates = format_iso_dates(self.processed_date)
+
+        records = [
+            {
+                "row_index": i,
+                "observation_date": obs_date,
+                "processed_date": proc_date,
+                "assignments": {
+                    dim: cat for dim, cat in zip(dims, cats) if cat is not None
+                },
+            }
+            for i, obs_date, proc_date, *cats in zip(
+                self.row_index.tolist(),
+                obs_dates,
+                proc_dates,
+                *(self.assignments[dim] for dim in dims),
+            )
+        ]
+
+        if self.observation_id is not None:
+            for rec, obs_id in zip(records, self.observation_id.tolist()):
+                rec["observation_id"] = obs_id
+        if self.text_hash is not None:
+            for rec, text_hash in zip(records, self.text_hash.tolist()):
+                rec["text_hash"] = text_hash
+        if self.assignment_scores is not None:
+            scores = self.assignment_scores
+            for i, rec in enumerate(records):
+                rec["assignment_scores"] = {
+                    dim: float(scores[dim][i])
+                    for dim in scores if not np.isnan(scores[dim][i])
+                }
+
+        return records
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> "CategoryAllocation":
+        dims: Dict[str, None] = {}
+        for rec in records:
+            for dim in (rec.get("assignments") or {}):
+                dims.setdefault(dim, None)
+
+        assignments = {
+            dim: np.array(
+                [(rec.get("assignments") or {}).get(dim) for rec in records],
+                dtype=object,
+            )
+            for dim in dims
+        }
+        observation_id = None
+        if any("observation_id" in rec for rec in records):
+            observation_id = np.array(
+                [rec.get("observation_id") for rec in records], dtype=object
+            )
+        text_hash = None
+        if any("text_hash" in rec for rec in records):
+            text_hash = np.array([rec.get("text_hash") for rec in records], dtype=object)
+        assignment_scores = None
+        if any("assignment_scores" in rec for rec in records):
+            assignment_scores = {
+                dim: np.array(
+                    [(rec.get("assignment_scores") or {}).get(dim, np.nan) for rec in records],
+                    dtype=float,
+                )
+                for dim in dims
+            }
+
+        return cls(
+            row_index=np.array([rec.get("row_index") for rec in records], dtype=np.int64),
+            observation_date=np.asarray(
+                pd.to_datetime(
+                    [rec.get("observation_date") for rec in records],
+                    format="ISO8601", errors="coerce",
+                ),
+                dtype="datetime64[us]",
+            ),
+            processed_date=np.asarray(
+                pd.to_datetime(
+                    [rec.get("processed_date") for rec in records],
+                    format="ISO8601", errors="coerce",
+                ),
+                dtype="datetime64[us]",
+            ),
+            assignments=assignments,
+            observation_id=observation_id,
+            text_hash=text_hash,
+            assignment_scores=assignment_scores,
+        )
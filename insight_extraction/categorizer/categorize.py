@@ -1,24 +1,102 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Sequence, Tuple
 
 import json
+import numpy as np
 import pandas as pd
 
 # --- Import from intern modules ---
-from insight_extraction.categorizer.embedding.model_loader import load_embedding_model
-from insight_extraction.categorizer.my_io.save_json import save_assignment_json
+from insight_extraction.categorizer.allocation import CategoryAllocation
+from insight_extraction.categorizer.embedding.model_loader import (
+    load_cross_encoder,
+    load_embedding_model,
+)
+from insight_extraction.categorizer.my_io.save_json import (
+    save_allocation,
+    save_allocation_async,
+)
 
 from insight_extraction.categorizer.my_io.data_loader import load_observations_df
+from insight_extraction.categorizer.sampling import stratified_sample
+from insight_extraction.categorizer.pushdown import intent_row_positions
 from insight_extraction.categorizer.embedding.embedder import embed_texts, embed_categories
 from insight_extraction.categorizer.matching.multi_matcher import match_all_dimensions
+from insight_extraction.categorizer.matching.reranker import (
+    build_category_passages,
+    rerank_low_margin_rows,
+)
+from insight_extraction.categorizer.matching.threshold_sweep import (
+    precompute_best_matches,
+    sweep_thresholds,
+)
 from insight_extraction.categorizer.analysis import (
     print_category_stats,
     plot_dimension_summary,
     plot_support_vs_mean_score,
     plot_category_support_bar,
     print_cluster_examples)
+
+
+def _load_json_file(path: str | Path) -> Any:
+    with Path(path).open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_allocation(
+    df: pd.DataFrame,
+    all_best_idx: Dict[str, Any],
+    dim2cat_embs: Dict[str, Dict[str, Any]],
+    obs_date_col: str = "Observation_date",
+    proc_date_col: str = "Processed_date",
+    max_examples: Optional[int] = None,
+    row_index: Optional[np.ndarray] = None,
+) -> CategoryAllocation:
+    """
+    Columnar category assignments: one array per field, no per-row
+    pandas access.
+
+    Category indices are mapped to names through one lookup array per
+    dimension (its trailing None covers -1 / out of range / rows missing
+    from best_idx).
+
+    row_index : positions of the rows of df in the original input when
+        df is a subset of it (e.g. a sample); defaults to 0..n-1.
+    """
+    n_rows = len(df)
+    if max_examples is not None:
+        n_rows = min(n_rows, max_examples)
+
+    assignments: Dict[str, np.ndarray] = {}
+    for dim_type, best_idx in all_best_idx.items():
+        cat_names = list(dim2cat_embs[dim_type].keys())
+        lookup = np.array(cat_names + [None], dtype=object)
+
+        idx = np.full(n_rows, -1, dtype=np.int64)
+        n_idx = min(n_rows, len(best_idx))
+        idx[:n_idx] = np.asarray(best_idx[:n_idx], dtype=np.int64)
+        idx[(idx < 0) | (idx >= len(cat_names))] = len(cat_names)
+
+        assignments[dim_type] = lookup[idx]
+
+    return CategoryAllocation(
+        row_index=(
+            np.arange(n_rows) if row_index is None
+            else np.asarray(row_index[:n_rows], dtype=np.int64)
+        ),
+        observation_date=np.asarray(
+            pd.to_datetime(df[obs_date_col].iloc[:n_rows], errors="coerce"),
+            dtype="datetime64[us]",
+        ),
+        processed_date=np.asarray(
+            pd.to_datetime(df[proc_date_col].iloc[:n_rows], errors="coerce"),
+            dtype="datetime64[us]",
+        ),
+        assignments=assignments,
+    )
+
+
 def build_assignment_json(
     df: pd.DataFrame,
     all_best_idx: Dict[str, Any],
@@ -31,6 +109,9 @@ def build_assignment_json(
     Build a list of JSON-serializable records containing category
     assignments for each row in the DataFrame.
 
+    The fields are computed column-wise (see build_allocation); the
+    per-row loop only assembles the dicts.
+
     Parameters
     ----------
     df : pd.DataFrame
@@ -52,48 +133,9 @@ def build_assignment_json(
     List[Dict[str, Any]]
         List of records ready to be saved as JSON.
     """
-    records: List[Dict[str, Any]] = []
-    n_rows = len(df)
-
-    if max_examples is not None:
-        n_rows = min(n_rows, max_examples)
-
-    for i in range(n_rows):
-        row = df.iloc[i]
-
-        rec: Dict[str, Any] = {
-            "row_index": int(i),
-            "observation_date": (
-                row[obs_date_col].isoformat()
-                if pd.notnull(row[obs_date_col])
-                else None
-            ),
-            "processed_date": (
-                row[proc_date_col].isoformat()
-                if pd.notnull(row[proc_date_col])
-                else None
-            ),
-            "assignments": {},
-        }
-
-        for dim_type, best_idx in all_best_idx.items():
-            if i >= len(best_idx):
-                continue
-
-            ci = int(best_idx[i])
-            if ci == -1:
-                # no category assigned
-                continue
-
-            cat_names = list(dim2cat_embs[dim_type].keys())
-            if ci < 0 or ci >= len(cat_names):
-                continue
-
-            rec["assignments"][dim_type] = cat_names[ci]
-
-        records.append(rec)
-
-    return records
+    return build_allocation(
+        df, all_best_idx, dim2cat_embs, obs_date_col, proc_date_col, max_examples
+    ).to_records()
 
 
 def run_pipeline(
@@ -108,9 +150,22 @@ def run_pipeline(
     expansions_path: Optional[str | Path] = None,
     similarity_threshold: float = 0.4,
     min_support_ratio: float = 0.01,
- 
+    matching_mode: str = "flat",
+    top_parents: int = 2,
+    multi_vector: bool = False,
+    pooling: str = "max",
+    rerank: bool = False,
+    rerank_margin: float = 0.05,
+    rerank_max_rows: int = 1000,
+    cross_encoder_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
     max_examples: Optional[int] = None,
-) -> None:
+    save_json: bool = True,
+    async_save: bool = False,
+    sample_fraction: Optional[float] = None,
+    sample_seed: Optional[int] = 0,
+    show_plots: bool = True,
+    pushdown: bool = False,
+) -> CategoryAllocation:
     """
     Run the full categorization pipeline:
 
@@ -119,8 +174,8 @@ def run_pipeline(
     3. Compute embeddings for observations.
     4. Compute embeddings for categories.
     5. Perform matching for all dimensions.
-    6. Build JSON assignment records.
-    7. Save the output to a file.
+    6. Build the columnar allocation.
+    7. Optionally save it as JSON records.
 
     Parameters
     ----------
@@ -130,7 +185,8 @@ def run_pipeline(
         Path to the JSON file with category definitions
         (e.g. structure with "group_by").
     output_path : str | Path
-        Where to save the JSON assignments output.
+        Where to save the assignments: JSON records (.json) or columnar
+        Parquet / Arrow IPC (.parquet, .arrow, .feather).
     sheet_name : str
         Excel sheet name to load.
     title_col, obs_col, obs_date_col, proc_date_col : str
@@ -141,8 +197,51 @@ def run_pipeline(
         Minimum cosine similarity threshold to consider a category.
     min_support_ratio : float
         Minimum support ratio to keep a category.
+    matching_mode : str
+        "flat" (every category) or "hierarchical" (parent centroids
+        first, then only the children of the top_parents best parents).
+    top_parents : int
+        Number of parents explored per row in hierarchical mode.
+    multi_vector : bool
+        Embed each synonym/example of a category separately instead of
+        one concatenated text per category.
+    pooling : str
+        How a multi-vector category is scored: "max" or "softmax".
+    rerank : bool
+        Re-rank borderline rows (top-two margin below rerank_margin) with
+        a CPU cross-encoder, at most rerank_max_rows rows per dimension.
+    cross_encoder_name : str
+        CrossEncoder model used when rerank is True.
     max_examples : Optional[int]
         Optional cap on the number of rows to process.
+    save_json : bool
+        Write the allocation to output_path.
+    async_save : bool
+        Write it in a background thread (see
+        CategoryAllocation.wait_for_persistence).
+    sample_fraction : Optional[float]
+        Preview mode: categorize only a sample stratified by month of
+        obs_date_col (see sampling.stratified_sample); row_index keeps
+        the positions in df and allocation.sample_design describes the
+        sample, for the scaled estimates of extraction.preview.
+    sample_seed : Optional[int]
+        Seed of the sample.
+    show_plots : bool
+        Show the category plots and cluster examples (off for background
+        runs).
+    pushdown : bool
+        Embed only the rows inside the intent time window and passing its
+        filters on raw columns (see pushdown.intent_row_positions);
+        row_index keeps the positions in df. Off by default because it
+        changes the results: min_support_ratio is computed on the kept
+        rows only (other categories may become active), and the raw-column
+        filters have no equivalent in the analytics table. When nothing
+        matches, the column filters and then the time window are dropped.
+
+    Returns
+    -------
+    CategoryAllocation
+        Columnar allocation, consumable directly by define_queries.
     """
 
     intent_path = Path(intent_path)
@@ -161,16 +260,51 @@ def run_pipeline(
 
     # 2. Load intent JSON
     print(f"[2/7] Carico intent JSON da: {intent_path}")
-    with intent_path.open("r", encoding="utf-8") as f:
-        intent = json.load(f)
-    
+    intent = _load_json_file(intent_path)
+
+    # positions in the input of the rows kept below
+    row_positions = np.arange(len(df))
+
+    # 2a. Intent time window / filters applied before the embeddings
+    if pushdown:
+        kept, applied = intent_row_positions(df, intent, obs_date_col)
+        if kept is not None and len(kept) == 0:
+            missed = ", ".join(applied)
+            # retry with the time window only, else embed every row
+            kept, applied = intent_row_positions(
+                df, intent, obs_date_col, column_filters=False
+            )
+            if kept is not None and len(kept) == 0:
+                kept = None
+            fallback = "pushdown disattivato" if kept is None else "filtri sulle colonne ignorati"
+            print(f"⚠️ Nessuna riga soddisfa {missed}: {fallback}.")
+        if kept is not None:
+            print(
+                f"[2a/7] Filtri dell'intent applicati prima degli embedding "
+                f"({', '.join(applied)}): {len(kept)}/{len(df)} righe"
+            )
+            df = df.iloc[kept].reset_index(drop=True)
+            row_positions = row_positions[kept]
+
+    sample_design = None
+    if sample_fraction is not None:
+        sampled, sample_design = stratified_sample(
+            df, obs_date_col, sample_fraction, random_state=sample_seed
+        )
+        df = df.iloc[sampled].reset_index(drop=True)
+        row_positions = row_positions[sampled]
+        print(
+            f"[2a/7] Preview: campione stratificato per mese di "
+            f"{sample_design.sample_size}/{sample_design.population_size} righe "
+            f"({len(sample_design.strata)} mesi)"
+        )
+
     # 2b. Load expansions if provided
     expansions = None
     if expansions_path is not None:
         expansions_path = Path(expansions_path)
         print(f"[2b/7] Carico expansions da: {expansions_path}")
-        with expansions_path.open("r", encoding="utf-8") as f:
-            expansions = json.load(f)
+        expansions = _load_json_file(expansions_path)
     # 3. Load model
     print(f"[3/7] Carico modello di embedding: {model_name}")
     model = load_embedding_model(model_name=model_name)
@@ -187,61 +321,143 @@ def run_pipeline(
             "Hai chiamato embed_categories senza expansions. "
             "Devi passare expansions_path a run_pipeline()."
         )
-    dim2cat_embs = embed_categories(model, intent, expansions)
+    dim2cat_embs = embed_categories(
+        model, intent, expansions, multi_vector=multi_vector
+    )
 
     # 6. Matching for all dimensions
     print("[6/7] Eseguo il matching categorie...")
+    # top-2 categories of the assigned rows, kept for the re-ranking
+    all_top = {} if rerank else None
     all_stats, all_best_idx = match_all_dimensions(
         intent=intent,
         obs_embs=obs_embs,
         dim2cat_embs=dim2cat_embs,
         similarity_threshold=similarity_threshold,
         min_support_ratio=min_support_ratio,
+        matching_mode=matching_mode,
+        expansions=expansions,
+        top_parents=top_parents,
+        pooling=pooling,
+        all_top=all_top,
     )
-    print_category_stats(all_stats)
 
-    # Summary plot per dimension
-    plot_dimension_summary(all_stats)
+    if rerank:
+        print(f"[6b/7] Re-ranking righe incerte con cross-encoder: {cross_encoder_name}")
+        changed = rerank_low_margin_rows(
+            texts=texts,
+            dim2cat_embs=dim2cat_embs,
+            all_stats=all_stats,
+            all_best_idx=all_best_idx,
+            all_top=all_top,
+            dim2passages=build_category_passages(dim2cat_embs, expansions),
+            cross_encoder=load_cross_encoder(cross_encoder_name),
+            margin_band=rerank_margin,
+            max_rows=rerank_max_rows,
+        )
+        for dim, n_changed in changed.items():
+            print(f"  - Dimensione '{dim}': {n_changed} righe riassegnate")
 
-    # Plot support vs mean_score
-    plot_support_vs_mean_score(all_stats)  # tutte le dimensioni insieme
-    # or for a specific dimension
-    # plot_support_vs_mean_score(all_stats, dimension_type="OBSERVATION_TYPE")
+    print_category_stats(all_stats)
 
-    # Bar chart of top categories for a dimension
-    plot_category_support_bar(
-        all_stats,
-        dimension_type="OBSERVATION_TYPE",
-        top_n=10,
-        normalize=False,
-    )
+    if show_plots:
+        # Summary plot per dimension
+        plot_dimension_summary(all_stats)
+
+        # Plot support vs mean_score
+        plot_support_vs_mean_score(all_stats)  # tutte le dimensioni insieme
+        # or for a specific dimension
+        # plot_support_vs_mean_score(all_stats, dimension_type="OBSERVATION_TYPE")
+
+        # Bar chart of top categories for a dimension
+        plot_category_support_bar(
+            all_stats,
+            dimension_type="OBSERVATION_TYPE",
+            top_n=10,
+            normalize=False,
+        )
 
-    # Text clustering (console only)
-    print_cluster_examples(
-        df=df,
-        all_best_idx=all_best_idx,
-        dim2cat_embs=dim2cat_embs,
-        text_col="text_for_embedding",
-        max_examples_per_category=5,
-    )
+        # Text clustering (console only)
+        print_cluster_examples(
+            df=df,
+            all_best_idx=all_best_idx,
+            dim2cat_embs=dim2cat_embs,
+            text_col="text_for_embedding",
+            max_examples_per_category=5,
+        )
 
     # (Optional) you can log a small summary of the stats
     for dim, stats in all_stats.items():
         print(f"  - Dimensione '{dim}': {len(stats)} categorie attive")
 
-    # 7. Build records + save JSON
-    print("[7/7] Costruisco i record di assegnazione...")
-    records = build_assignment_json(
+    # 7. Build allocation + save JSON
+    print("[7/7] Costruisco l'allocazione delle categorie...")
+    allocation = build_allocation(
         df=df,
         all_best_idx=all_best_idx,
         dim2cat_embs=dim2cat_embs,
         obs_date_col=obs_date_col,
         proc_date_col=proc_date_col,
         max_examples=max_examples,
+        row_index=row_positions,
     )
+    allocation.sample_design = sample_design
 
-    print(f"Salvo {len(records)} record in: {output_path}")
-    save_assignment_json(records, str(output_path))
+    if save_json and async_save:
+        print(f"Salvo {len(allocation)} record in background in: {output_path}")
+        allocation.pending_writes.append(
+            save_allocation_async(allocation, str(output_path))
+        )
+    elif save_json:
+        print(f"Salvo {len(allocation)} record in: {output_path}")
+        save_allocation(allocation, str(output_path))
 
     print("✅ Pipeline completata.")
+    return allocation
+
+
+def run_threshold_sweep(
+    df: pd.DataFrame,
+    intent_path: str | Path,
+    expansions_path: str | Path,
+    similarity_thresholds: Sequence[float] = (0.2, 0.3, 0.4, 0.5),
+    min_support_ratios: Sequence[float] = (0.0, 0.01, 0.05),
+    title_col: str = "Title",
+    obs_col: str = "Observation",
+    obs_date_col: str = "Observation_date",
+    proc_date_col: str = "Processed_date",
+    model_name: str = "all-MiniLM-L6-v2",
+    multi_vector: bool = False,
+    pooling: str = "max",
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Tune similarity_threshold / min_support_ratio without re-running
+    run_pipeline for every combination.
+
+    Observations and categories are embedded once and the best match per
+    row is computed once; every combination is then evaluated on those
+    arrays (see matching.threshold_sweep.sweep_thresholds).
+
+    Returns
+    -------
+    Tuple[pd.DataFrame, pd.DataFrame]
+        (coverage_df, support_df) as returned by sweep_thresholds.
+    """
+    df = load_observations_df(
+        df=df,
+        title_col=title_col,
+        obs_col=obs_col,
+        obs_date_col=obs_date_col,
+        proc_date_col=proc_date_col,
+    )
+    intent = _load_json_file(intent_path)
+    expansions = _load_json_file(expansions_path)
+
+    model = load_embedding_model(model_name=model_name)
+    obs_embs = embed_texts(model, df["text_for_embedding"].tolist())
+    dim2cat_embs = embed_categories(
+        model, intent, expansions, multi_vector=multi_vector
+    )
 
+    best_matches = precompute_best_matches(obs_embs, dim2cat_embs, pooling=pooling)
+    return sweep_thresholds(best_matches, similarity_thresholds, min_support_ratios)
@@ -35,16 +35,33 @@ def build_category_text(cat: Dict[str, Any]) -> str:
     ).strip()
 
 
+def build_category_texts(cat: Dict[str, Any]) -> List[str]:
+    """
+    Texts for the multi-vector representation: the full category text
+    plus one short text per synonym and per example.
+    """
+    name = cat.get("name", "")
+    texts = [build_category_text(cat)]
+    texts += [f"{name}: {syn}" for syn in cat.get("synonyms", [])]
+    texts += list(cat.get("examples", []))
+    return texts
+
+
 def embed_categories(
     model: SentenceTransformer,
     intent: Dict[str, Any],
-    expansions: Dict[str, Dict[str, Any]]
+    expansions: Dict[str, Dict[str, Any]],
+    multi_vector: bool = False,
 ) -> Dict[str, Dict[str, np.ndarray]]:
     """
     Improved version:
     - Use expansions to create rich texts
         for each category.
     - Embed those texts instead of using only the category names.
+
+    With multi_vector=True each category maps to a (k, d) matrix (full
+    text + each synonym/example embedded separately) instead of a single
+    (d,) vector; all texts of a dimension are embedded in one batch.
     """
     dim2cat_embs = {}
 
@@ -64,19 +81,32 @@ def embed_categories(
         rich_texts = []
         valid_values = []
 
+        n_texts = []
+
         for v in values:
             if v not in exp_for_dim:
                 continue
 
-            rich_text = build_category_text(exp_for_dim[v])
-            rich_texts.append(rich_text)
+            if multi_vector:
+                texts = build_category_texts(exp_for_dim[v])
+            else:
+                texts = [build_category_text(exp_for_dim[v])]
+            rich_texts.extend(texts)
+            n_texts.append(len(texts))
             valid_values.append(v)
 
         if rich_texts:
             vectors = embed_texts(model, rich_texts)
 
-            dim2cat_embs[dim] = {
-                v: vectors[i] for i, v in enumerate(valid_values)
-            }
+            if multi_vector:
+                bounds = np.cumsum([0] + n_texts)
+                dim2cat_embs[dim] = {
+                    v: vectors[bounds[i]:bounds[i + 1]]
+                    for i, v in enumerate(valid_values)
+                }
+            else:
+                dim2cat_embs[dim] = {
+                    v: vectors[i] for i, v in enumerate(valid_values)
+                }
 
     return dim2cat_embs
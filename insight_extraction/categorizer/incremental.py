@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+import json
+import numpy as np
+import pandas as pd
+
+from insight_extraction.categorizer.allocation import CategoryAllocation
+from insight_extraction.categorizer.categorize import _load_json_file, build_allocation
+from insight_extraction.categorizer.embedding.model_loader import load_embedding_model
+from insight_extraction.categorizer.embedding.embedder import embed_texts, embed_categories
+from insight_extraction.categorizer.matching.matcher import (
+    CategoryStats,
+    assign_categories,
+    compute_best_matches,
+)
+from insight_extraction.categorizer.my_io.data_loader import load_observations_df
+from insight_extraction.categorizer.my_io.save_json import (
+    COLUMNAR_SUFFIXES,
+    save_allocation,
+    save_assignment_json,
+)
+from insight_extraction.extraction.table_creator import (
+    build_analytics_dataframe,
+    load_assignments,
+    save_dataframe_to_sqlite,
+    upsert_dataframe_to_sqlite,
+)
+
+
+def compute_text_hashes(texts: pd.Series) -> np.ndarray:
+    """
+    Stable hash of each observation text, used to detect changed rows.
+    """
+    hashed = pd.util.hash_pandas_object(texts.reset_index(drop=True), index=False)
+    return np.array([format(h, "016x") for h in hashed.tolist()], dtype=object)
+
+
+def save_category_stats(
+    all_stats: Dict[str, Dict[str, CategoryStats]],
+    n_rows: int,
+    output_path: str | Path,
+) -> None:
+    payload = {
+        "n_rows": n_rows,
+        "stats": {
+            dim: [asdict(s) for s in cat2stats.values()]
+            for dim, cat2stats in all_stats.items()
+        },
+    }
+    with Path(output_path).open("w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+
+
+def load_category_stats(
+    stats_path: str | Path,
+) -> Tuple[Dict[str, Dict[str, CategoryStats]], int]:
+    payload = _load_json_file(stats_path)
+    all_stats = {
+        dim: {s["category"]: CategoryStats(**s) for s in stats_list}
+        for dim, stats_list in payload.get("stats", {}).items()
+    }
+    return all_stats, int(payload.get("n_rows", 0))
+
+
+def update_category_stats(
+    cat2stats: Dict[str, CategoryStats],
+    dim_type: str,
+    removed: List[Tuple[str, float]],
+    added: List[Tuple[str, float]],
+    n_rows: int,
+) -> None:
+    """
+    Update the running stats of one dimension in place.
+
+    removed / added are (category, score) pairs of the assignments that
+    disappear (changed rows) and appear (new or changed rows); n_rows is
+    the total number of observations after the merge.
+    """
+    totals = {
+        name: [s.support_count, s.mean_score * s.support_count]
+        for name, s in cat2stats.items()
+    }
+
+    for cat, score in removed:
+        if cat in totals:
+            totals[cat][0] -= 1
+            totals[cat][1] -= score
+
+    for cat, score in added:
+        totals.setdefault(cat, [0, 0.0])
+        totals[cat][0] += 1
+        totals[cat][1] += score
+
+    for cat, (count, score_sum) in totals.items():
+        stats = cat2stats.get(cat)
+        if stats is None:
+            stats = CategoryStats(dim_type, cat, 0, 0.0, 0.0)
+            cat2stats[cat] = stats
+        stats.support_count = int(count)
+        stats.support_ratio = count / n_rows if n_rows else 0
+        stats.mean_score = float(score_sum / count) if count else 0
+
+
+def _merge_column(
+    stored: Optional[np.ndarray],
+    new: Optional[np.ndarray],
+    n_stored: int,
+    positions: np.ndarray,
+    fill: Any,
+    dtype: Any,
+) -> np.ndarray:
+    """
+    stored with new[positions >= 0] written at those positions and the
+    other rows of new appended; a missing side is filled with fill.
+    """
+    replace = positions >= 0
+    if stored is None:
+        stored = np.full(n_stored, fill, dtype=dtype)
+    if new is None:
+        new = np.full(len(positions), fill, dtype=dtype)
+    merged = stored.copy()
+    merged[positions[replace]] = new[replace]
+    return np.concatenate([merged, new[~replace]])
+
+
+def merge_allocations(
+    stored: CategoryAllocation,
+    new: CategoryAllocation,
+    positions: np.ndarray,
+) -> CategoryAllocation:
+    """
+    Column-wise merge of the incremental pipeline: the rows of new with
+    positions >= 0 replace those rows of stored, the others are appended.
+    """
+    n = len(stored)
+
+    def merge_dict(
+        old: Optional[Dict[str, np.ndarray]],
+        upd: Optional[Dict[str, np.ndarray]],
+        fill: Any,
+        dtype: Any,
+    ) -> Dict[str, np.ndarray]:
+        old, upd = old or {}, upd or {}
+        return {
+            dim: _merge_column(old.get(dim), upd.get(dim), n, positions, fill, dtype)
+            for dim in dict.fromkeys([*old, *upd])
+        }
+
+    return CategoryAllocation(
+        row_index=_merge_column(stored.row_index, new.row_index, n, positions, -1, np.int64),
+        observation_date=_merge_column(
+            stored.observation_date, new.observation_date, n, positions,
+            np.datetime64("NaT"), "datetime64[us]",
+        ),
+        processed_date=_merge_column(
+            stored.processed_date, new.processed_date, n, positions,
+            np.datetime64("NaT"), "datetime64[us]",
+        ),
+        assignments=merge_dict(stored.assignments, new.assignments, None, object),
+        observation_id=_merge_column(
+            stored.observation_id, new.observation_id, n, positions, None, object
+        ),
+        text_hash=_merge_column(stored.text_hash, new.text_hash, n, positions, None, object),
+        assignment_scores=merge_dict(
+            stored.assignment_scores, new.assignment_scores, np.nan, float
+        ),
+    )
+
+
+def run_incremental_pipeline(
+    df: pd.DataFrame,
+    intent_path: str | Path,
+    expansions_path: str | Path,
+    allocation_path: str | Path,
+    db_path: str | Path,
+    id_col: str = "Event_ID",
+    title_col: str = "Title",
+    obs_col: str = "Observation",
+    obs_date_col: str = "Observation_date",
+    proc_date_col: str = "Processed_date",
+    model_name: str = "all-MiniLM-L6-v2",
+    similarity_threshold: float = 0.4,
+    min_support_ratio: float = 0.01,
+    stats_path: Optional[str | Path] = None,
+    table_name: str = "observations_enriched",
+) -> Dict[str, Dict[str, CategoryStats]]:
+    """
+    Categorize only the observations that are new or whose text changed
+    since the last run, keyed by a stable observation id.
+
+    The first run (no stored allocation) categorizes everything and
+    selects the active categories with min_support_ratio, exactly like
+    run_pipeline. Later runs match new/changed rows against those active
+    categories only, merge them column-wise into the stored allocation
+    (merge_allocations), update the running CategoryStats in place and
+    upsert the rows into table_name.
+
+    allocation_path may be JSON or columnar (.parquet / .arrow /
+    .feather), read and written in the format of its suffix. The first
+    run rebuilds table_name from scratch, so a table loaded without
+    observation ids is replaced rather than upserted into.
+
+    Returns
+    -------
+    Dict[str, Dict[str, CategoryStats]]
+        The updated stats (dimension_type -> category -> CategoryStats).
+    """
+    allocation_path = Path(allocation_path)
+    if stats_path is None:
+        stats_path = allocation_path.with_name(f"{allocation_path.stem}_stats.json")
+    stats_path = Path(stats_path)
+
+    df = load_observations_df(
+        df=df,
+        title_col=title_col,
+        obs_col=obs_col,
+        obs_date_col=obs_date_col,
+        proc_date_col=proc_date_col,
+    )
+    if id_col not in df.columns:
+        raise ValueError(f"Column '{id_col}' does not exist in the DataFrame.")
+    if df[id_col].duplicated().any():
+        raise ValueError(f"Column '{id_col}' must uniquely identify observations.")
+
+    ids = df[id_col].astype(str).to_numpy()
+    hashes = compute_text_hashes(df["text_for_embedding"])
+
+    bootstrap = not (allocation_path.exists() and stats_path.exists())
+    stored: Optional[CategoryAllocation] = None
+    all_stats: Dict[str, Dict[str, CategoryStats]] = {}
+    positions = np.full(len(df), -1, dtype=np.int64)
+    if not bootstrap:
+        stored = load_assignments(allocation_path)
+        if not isinstance(stored, CategoryAllocation):
+            # JSON allocation: records only at the file boundary
+            stored = CategoryAllocation.from_records(stored)
+        if stored.observation_id is None or pd.isna(stored.observation_id).any():
+            raise ValueError(
+                f"{allocation_path} has no observation ids: it was not "
+                f"produced by the incremental pipeline."
+            )
+        all_stats, _ = load_category_stats(stats_path)
+        positions = pd.Index(stored.observation_id).get_indexer(ids)
+
+    todo = positions < 0
+    if stored is not None:
+        known = ~todo
+        stored_hashes = (
+            stored.text_hash if stored.text_hash is not None
+            else np.full(len(stored), None, dtype=object)
+        )
+        todo[known] = stored_hashes[positions[known]] != hashes[known]
+
+    n_todo = int(todo.sum())
+    print(f"[incremental] {n_todo} nuove/modificate su {len(df)} osservazioni")
+    if n_todo == 0:
+        return all_stats
+
+    sub = df[todo].reset_index(drop=True)
+    sub_ids = ids[todo]
+    sub_hashes = hashes[todo]
+
+    intent = _load_json_file(intent_path)
+    expansions = _load_json_file(expansions_path)
+
+    model = load_embedding_model(model_name=model_name)
+    obs_embs = embed_texts(model, sub["text_for_embedding"].tolist())
+    dim2cat_embs = embed_categories(model, intent, expansions)
+
+    active_embs: Dict[str, Dict[str, np.ndarray]] = {}
+    all_best_idx: Dict[str, np.ndarray] = {}
+    all_best_scores: Dict[str, np.ndarray] = {}
+
+    for dim, cat_embs in dim2cat_embs.items():
+        if not bootstrap:
+            # later runs only match against the categories already active
+            active = all_stats.get(dim, {})
+            cat_embs = {c: v for c, v in cat_embs.items() if c in active}
+
+        cat_names, best_idx, best_scores = compute_best_matches(cat_embs, obs_embs)
+        stats, remapped = assign_categories(
+            dim, cat_names, best_idx, best_scores,
+            similarity_threshold,
+            min_support_ratio if bootstrap else 0.0,
+        )
+        if bootstrap:
+            all_stats[dim] = stats
+
+        active_embs[dim] = cat_embs
+        all_best_idx[dim] = remapped
+        all_best_scores[dim] = best_scores
+
+    new = build_allocation(
+        df=sub,
+        all_best_idx=all_best_idx,
+        dim2cat_embs=active_embs,
+        obs_date_col=obs_date_col,
+        proc_date_col=proc_date_col,
+    )
+    new.observation_id = sub_ids.astype(object)
+    new.text_hash = sub_hashes
+    new.assignment_scores = {
+        dim: np.where(all_best_idx[dim] != -1, all_best_scores[dim], np.nan)
+        for dim in new.assignments
+    }
+
+    if stored is None:
+        allocation = new
+    else:
+        # changed rows keep their row_index, new ones follow the last one
+        sub_pos = positions[todo]
+        changed = sub_pos >= 0
+        next_index = int(stored.row_index.max()) + 1 if len(stored) else 0
+        new.row_index[changed] = stored.row_index[sub_pos[changed]]
+        new.row_index[~changed] = next_index + np.arange(int((~changed).sum()))
+
+        n_total = len(stored) + int((~changed).sum())
+        old_pos = sub_pos[changed]
+        for dim in set(all_stats) | set(new.assignments) | set(stored.assignments):
+            old_cats = stored.assignments.get(dim)
+            old_scores = (stored.assignment_scores or {}).get(dim)
+            removed = []
+            if old_cats is not None:
+                cats = old_cats[old_pos]
+                scores = (
+                    np.zeros(len(old_pos)) if old_scores is None
+                    else np.nan_to_num(old_scores[old_pos])
+                )
+                removed = [(c, float(x)) for c, x in zip(cats, scores) if c is not None]
+            added = []
+            if dim in new.assignments:
+                added = [
+                    (c, float(x))
+                    for c, x in zip(new.assignments[dim], new.assignment_scores[dim])
+                    if c is not None
+                ]
+            update_category_stats(
+                all_stats.setdefault(dim, {}), dim, removed, added, n_rows=n_total,
+            )
+
+        allocation = merge_allocations(stored, new, sub_pos)
+
+    print(f"Salvo {len(allocation)} record in: {allocation_path}")
+    if allocation_path.suffix in COLUMNAR_SUFFIXES:
+        save_allocation(allocation, str(allocation_path))
+    else:
+        save_assignment_json(allocation.to_records(), str(allocation_path))
+    save_category_stats(all_stats, len(allocation), stats_path)
+
+    table = build_analytics_dataframe(new)
+    if bootstrap:
+        # every observation was categorized: the table is rebuilt
+        save_dataframe_to_sqlite(table, db_path, table_name=table_name)
+        print(f"✅ {table_name} ricreata con {len(new)} righe.")
+    else:
+        upsert_dataframe_to_sqlite(
+            table,
+            db_path,
+            key_col="observation_id",
+            table_name=table_name,
+        )
+        print(f"✅ Upsert di {len(new)} righe in {table_name}.")
+
+    return all_stats
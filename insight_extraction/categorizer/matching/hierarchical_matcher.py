@@ -0,0 +1,104 @@
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+from insight_extraction.categorizer.matching.matcher import (
+    pool_segments,
+    stack_category_vectors,
+)
+
+
+def build_category_hierarchy(
+    cat_names: List[str],
+    exp_for_dim: Optional[Dict[str, Any]] = None,
+) -> Dict[str, List[int]]:
+    """
+    Group category indices by parent.
+
+    A category declares its parent with an optional "parent" field in its
+    expansion; categories without a parent form a group on their own.
+    """
+    exp_for_dim = exp_for_dim or {}
+    hierarchy: Dict[str, List[int]] = {}
+
+    for i, name in enumerate(cat_names):
+        entry = exp_for_dim.get(name) or {}
+        parent = entry.get("parent") or name
+        hierarchy.setdefault(parent, []).append(i)
+
+    return hierarchy
+
+
+def compute_best_matches_hierarchical(
+    cat_embs: Dict[str, np.ndarray],
+    obs_embs: np.ndarray,
+    hierarchy: Dict[str, List[int]],
+    top_parents: int = 2,
+    pooling: str = "max",
+    temperature: float = 0.05,
+) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Coarse-to-fine version of compute_best_matches.
+
+    Observations are first compared with one centroid per parent; each
+    observation is then compared only with the children of its
+    top_parents closest parents. Output format is the same as the flat
+    matcher (indices refer to the leaf categories in cat_embs order).
+    """
+    cat_names = list(cat_embs.keys())
+    N = len(obs_embs)
+    if not cat_names:
+        return cat_names, np.full(N, -1), np.zeros(N)
+
+    _, matrix, starts = stack_category_vectors(cat_embs)
+    matrix = normalize(matrix)
+    ends = np.append(starts[1:], len(matrix))
+    cat_centroids = np.stack([matrix[a:b].mean(axis=0) for a, b in zip(starts, ends)])
+
+    parents = list(hierarchy.keys())
+    children = [np.asarray(hierarchy[p]) for p in parents]
+
+    # rows of `matrix` (and segment starts) covered by each parent's children
+    child_rows = []
+    child_starts = []
+    for ch in children:
+        sizes = ends[ch] - starts[ch]
+        child_rows.append(np.concatenate([np.arange(starts[c], ends[c]) for c in ch]))
+        child_starts.append(np.concatenate(([0], np.cumsum(sizes)[:-1])))
+
+    # normalize once, so the per-parent steps are plain matmuls
+    obs_n = normalize(obs_embs)
+    centroids = np.stack([cat_centroids[ch].mean(axis=0) for ch in children])
+    parent_sims = cosine_similarity(obs_n, centroids)
+
+    k = min(top_parents, len(parents))
+    top = np.argpartition(-parent_sims, k - 1, axis=1)[:, :k]
+
+    # group the (row, parent) pairs by parent with a single sort
+    flat_parent = top.ravel()
+    order = np.argsort(flat_parent, kind="stable")
+    bounds = np.searchsorted(flat_parent[order], np.arange(len(parents) + 1))
+
+    pair_idx = np.zeros(N * k, dtype=int)
+    pair_scores = np.full(N * k, -np.inf)
+
+    for pi, ch in enumerate(children):
+        pairs = order[bounds[pi]:bounds[pi + 1]]
+        if pairs.size == 0:
+            continue
+
+        sims = pool_segments(
+            obs_n[pairs // k] @ matrix[child_rows[pi]].T,
+            child_starts[pi], pooling, temperature,
+        )
+        local = sims.argmax(axis=1)
+        pair_scores[pairs] = sims[np.arange(len(pairs)), local]
+        pair_idx[pairs] = ch[local]
+
+    pair_scores = pair_scores.reshape(N, k)
+    best_slot = pair_scores.argmax(axis=1)
+    rows = np.arange(N)
+    best_idx = pair_idx.reshape(N, k)[rows, best_slot]
+    best_scores = pair_scores[rows, best_slot]
+
+    return cat_names, best_idx, best_scores
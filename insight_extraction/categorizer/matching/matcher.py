@@ -1,6 +1,6 @@
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple
 from dataclasses import dataclass
 
 @dataclass
@@ -11,47 +11,196 @@ class CategoryStats:
     support_ratio: float
     mean_score: float
 
-def match_categories_for_dimension(
-    dim_type: str,
+
+@dataclass
+class TopMatches:
+    """
+    The top_k active categories of the assigned rows of one dimension,
+    kept by match_all_dimensions for the cross-encoder re-ranking.
+    """
+    rows: np.ndarray     # positions of the observations with a category
+    cat_idx: np.ndarray  # (len(rows), k) category indices, best first
+    scores: np.ndarray   # (len(rows), k) their scores, -inf below the threshold
+    best_scores: np.ndarray  # (len(rows),) score of the current assignment
+
+
+def stack_category_vectors(
     cat_embs: Dict[str, np.ndarray],
-    obs_embs: np.ndarray,
-    similarity_threshold: float = 0.4,
-    min_support_ratio: float = 0.01
-) -> Tuple[Dict[str, CategoryStats], np.ndarray]:
+) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Stack the category vectors into one matrix.
 
+    A category can be a single vector (d,) or several vectors (k, d)
+    (multi-vector representation). Returns the category names, the
+    (M, d) matrix and the start row of each category in it.
+    """
     cat_names = list(cat_embs.keys())
-    if not cat_names:
-        return {}, np.full(len(obs_embs), -1)
+    blocks = [np.atleast_2d(cat_embs[c]) for c in cat_names]
+    sizes = np.array([len(b) for b in blocks], dtype=int)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(int)
+    return cat_names, np.vstack(blocks), starts
+
+
+def pool_segments(
+    sims: np.ndarray,
+    starts: np.ndarray,
+    pooling: str = "max",
+    temperature: float = 0.05,
+) -> np.ndarray:
+    """
+    Reduce (N, M) similarities to (N, C) category scores, where the
+    columns of category c are starts[c]:starts[c+1].
+
+    pooling:
+      - "max": best similarity among the category vectors.
+      - "softmax": softmax(s / temperature)-weighted mean of the
+        similarities (a smooth max).
+    """
+    if pooling not in ("max", "softmax"):
+        raise ValueError(f"Unknown pooling: {pooling}")
+
+    if len(starts) == sims.shape[1]:
+        # one vector per category: nothing to reduce
+        return sims
+
+    seg_max = np.maximum.reduceat(sims, starts, axis=1)
+    if pooling == "max":
+        return seg_max
+
+    sizes = np.diff(np.append(starts, sims.shape[1]))
+    weights = np.exp((sims - np.repeat(seg_max, sizes, axis=1)) / temperature)
+    return (
+        np.add.reduceat(weights * sims, starts, axis=1)
+        / np.add.reduceat(weights, starts, axis=1)
+    )
+
+
+def compute_category_scores(
+    cat_embs: Dict[str, np.ndarray],
+    obs_embs: np.ndarray,
+    pooling: str = "max",
+    temperature: float = 0.05,
+) -> Tuple[List[str], np.ndarray]:
+    """
+    Full (N, C) observation x category score matrix.
+
+    Multi-vector categories are scored with a single matmul over all
+    vectors followed by a segment reduction (see pool_segments).
+    """
+    cat_names, matrix, starts = stack_category_vectors(cat_embs)
+    sims = pool_segments(
+        cosine_similarity(obs_embs, matrix), starts, pooling, temperature
+    )
+    return cat_names, sims
+
+
+def compute_best_matches(
+    cat_embs: Dict[str, np.ndarray],
+    obs_embs: np.ndarray,
+    pooling: str = "max",
+    temperature: float = 0.05,
+) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Compute, for every observation, the index and the cosine similarity
+    of the closest category.
 
-    matrix = np.stack([cat_embs[c] for c in cat_names])
-    sims = cosine_similarity(obs_embs, matrix)
+    This is the expensive part of the matching (one similarity matrix);
+    thresholds and support filters can be applied afterwards on the
+    returned arrays without touching the embeddings again.
+    """
+    if not cat_embs:
+        return [], np.full(len(obs_embs), -1), np.zeros(len(obs_embs))
+
+    cat_names, sims = compute_category_scores(cat_embs, obs_embs, pooling, temperature)
 
     best_idx = sims.argmax(axis=1)
     best_scores = sims[np.arange(len(obs_embs)), best_idx]
+
+    return cat_names, best_idx, best_scores
+
+
+def top_active_matches(
+    sims: np.ndarray,
+    rows: np.ndarray,
+    active: np.ndarray,
+    best_scores: np.ndarray,
+    top_k: int = 2,
+    similarity_threshold: float = 0.4,
+) -> TopMatches:
+    """
+    Keep, for the (len(rows), C) scores of the given rows, the top_k
+    categories among the active ones (indices into the C columns).
+    Categories scoring below similarity_threshold, which the row could
+    not have been assigned to, get a score of -inf. best_scores are
+    the scores of the current assignments of the rows.
+    """
+    sims = sims[:, active]
+    k = min(top_k, len(active))
+    local = np.argsort(-sims, axis=1)[:, :k]
+    scores = np.take_along_axis(sims, local, axis=1)
+    scores = np.where(scores >= similarity_threshold, scores, -np.inf)
+    return TopMatches(
+        rows=rows, cat_idx=active[local], scores=scores, best_scores=best_scores
+    )
+
+
+def assign_categories(
+    dim_type: str,
+    cat_names: List[str],
+    best_idx: np.ndarray,
+    best_scores: np.ndarray,
+    similarity_threshold: float = 0.4,
+    min_support_ratio: float = 0.01
+) -> Tuple[Dict[str, CategoryStats], np.ndarray]:
+    """
+    Apply the similarity threshold and the minimum support ratio to
+    precomputed best matches (see compute_best_matches).
+    """
+    N = len(best_idx)
+    if not cat_names:
+        return {}, np.full(N, -1)
+
     mask = best_scores >= similarity_threshold
+    counts = np.bincount(best_idx[mask], minlength=len(cat_names))
+    score_sums = np.bincount(
+        best_idx[mask], weights=best_scores[mask], minlength=len(cat_names)
+    )
+    ratios = counts / N if N else np.zeros(len(cat_names))
+    valid_mask = ratios >= min_support_ratio
 
-    N = len(obs_embs)
     stats = {}
-    valid_mask = np.zeros(len(cat_names), dtype=bool)
-
     for i, cname in enumerate(cat_names):
-        sel = (best_idx == i) & mask
-        count = int(sel.sum())
-        ratio = count / N if N else 0
-
-        if ratio >= min_support_ratio:
-            stats[cname] = CategoryStats(
-                dimension_type=dim_type,
-                category=cname,
-                support_count=count,
-                support_ratio=ratio,
-                mean_score=float(best_scores[sel].mean()) if count else 0
-            )
-            valid_mask[i] = True
-
-    remapped = np.array([
-        idx if mask[j] and valid_mask[idx] else -1
-        for j, idx in enumerate(best_idx)
-    ])
+        if not valid_mask[i]:
+            continue
+        count = int(counts[i])
+        stats[cname] = CategoryStats(
+            dimension_type=dim_type,
+            category=cname,
+            support_count=count,
+            support_ratio=float(ratios[i]),
+            mean_score=float(score_sums[i] / count) if count else 0
+        )
+
+    remapped = np.where(mask & valid_mask[best_idx], best_idx, -1)
 
     return stats, remapped
+
+
+def match_categories_for_dimension(
+    dim_type: str,
+    cat_embs: Dict[str, np.ndarray],
+    obs_embs: np.ndarray,
+    similarity_threshold: float = 0.4,
+    min_support_ratio: float = 0.01,
+    pooling: str = "max",
+    temperature: float = 0.05,
+) -> Tuple[Dict[str, CategoryStats], np.ndarray]:
+
+    cat_names, best_idx, best_scores = compute_best_matches(
+        cat_embs, obs_embs, pooling, temperature
+    )
+
+    return assign_categories(
+        dim_type, cat_names, best_idx, best_scores,
+        similarity_threshold, min_support_ratio
+    )
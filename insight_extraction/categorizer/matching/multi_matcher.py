@@ -1,27 +1,100 @@
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 import numpy as np
-from insight_extraction.categorizer.matching.matcher import match_categories_for_dimension
+from insight_extraction.categorizer.matching.matcher import (
+    TopMatches,
+    assign_categories,
+    compute_best_matches,
+    compute_category_scores,
+    top_active_matches,
+)
+from insight_extraction.categorizer.matching.hierarchical_matcher import (
+    build_category_hierarchy,
+    compute_best_matches_hierarchical,
+)
 
 def match_all_dimensions(
     intent: Dict[str, any],
     obs_embs: np.ndarray,
     dim2cat_embs: Dict[str, Dict[str, np.ndarray]],
     similarity_threshold: float = 0.4,
-    min_support_ratio: float = 0.01
+    min_support_ratio: float = 0.01,
+    matching_mode: str = "flat",
+    expansions: Optional[Dict[str, Dict[str, any]]] = None,
+    top_parents: int = 2,
+    pooling: str = "max",
+    temperature: float = 0.05,
+    all_top: Optional[Dict[str, TopMatches]] = None,
+    top_k: int = 2,
 ) -> Tuple[
     Dict[str, Dict[str, any]],
     Dict[str, np.ndarray]
 ]:
+    """
+    matching_mode:
+      - "flat": compare every observation with every category.
+      - "hierarchical": compare with parent centroids first, then only
+        with the children of the top_parents closest parents (parents
+        are read from the "parent" field of the expansions).
+
+    pooling / temperature: how multi-vector categories are scored
+    (see matcher.pool_segments).
+
+    all_top: when given, filled in place with the top_k active categories
+    of the assigned rows of each dimension (matcher.TopMatches), the input
+    of reranker.rerank_low_margin_rows. The flat mode takes them from the
+    score matrix it already computes; the hierarchical one, which never
+    builds it, scores the assigned rows against the active categories.
+    """
+    if matching_mode not in ("flat", "hierarchical"):
+        raise ValueError(f"Unknown matching_mode: {matching_mode}")
 
     all_stats = {}
     all_best = {}
 
     for dim, cat_embs in dim2cat_embs.items():
-        stats, best = match_categories_for_dimension(
-            dim, cat_embs, obs_embs,
+        sims = None
+        if matching_mode == "hierarchical":
+            hierarchy = build_category_hierarchy(
+                list(cat_embs.keys()), (expansions or {}).get(dim)
+            )
+            cat_names, best_idx, best_scores = compute_best_matches_hierarchical(
+                cat_embs, obs_embs, hierarchy, top_parents, pooling, temperature
+            )
+        elif all_top is not None and cat_embs:
+            cat_names, sims = compute_category_scores(
+                cat_embs, obs_embs, pooling, temperature
+            )
+            best_idx = sims.argmax(axis=1)
+            best_scores = sims[np.arange(len(obs_embs)), best_idx]
+        else:
+            cat_names, best_idx, best_scores = compute_best_matches(
+                cat_embs, obs_embs, pooling, temperature
+            )
+
+        stats, best = assign_categories(
+            dim, cat_names, best_idx, best_scores,
             similarity_threshold, min_support_ratio
         )
         all_stats[dim] = stats
         all_best[dim] = best
 
+        if all_top is not None:
+            active = np.array([i for i, c in enumerate(cat_names) if c in stats], dtype=int)
+            rows = np.where(best != -1)[0]
+            if len(active) < 2 or rows.size == 0:
+                continue
+            if sims is None:
+                # hierarchical: score only the assigned rows, against the active categories
+                _, active_sims = compute_category_scores(
+                    {cat_names[i]: cat_embs[cat_names[i]] for i in active},
+                    obs_embs[rows], pooling, temperature,
+                )
+                row_sims = np.full((rows.size, len(cat_names)), -np.inf)
+                row_sims[:, active] = active_sims
+            else:
+                row_sims = sims[rows]
+            all_top[dim] = top_active_matches(
+                row_sims, rows, active, best_scores[rows], top_k, similarity_threshold
+            )
+
     return all_stats, all_best
@@ -0,0 +1,115 @@
+from typing import Any, Dict, List
+import numpy as np
+from insight_extraction.categorizer.embedding.embedder import build_category_text
+from insight_extraction.categorizer.matching.matcher import (
+    CategoryStats,
+    TopMatches,
+)
+
+
+def build_category_passages(
+    dim2cat_embs: Dict[str, Dict[str, Any]],
+    expansions: Dict[str, Dict[str, Any]],
+) -> Dict[str, Dict[str, str]]:
+    """
+    Text used as the second member of each cross-encoder pair.
+    Falls back to the category name when there is no expansion.
+    """
+    passages: Dict[str, Dict[str, str]] = {}
+    for dim, cat_embs in dim2cat_embs.items():
+        exp_for_dim = expansions.get(dim, {}) or {}
+        passages[dim] = {
+            name: build_category_text(exp_for_dim[name]) if name in exp_for_dim else name
+            for name in cat_embs
+        }
+    return passages
+
+
+def rerank_low_margin_rows(
+    texts: List[str],
+    dim2cat_embs: Dict[str, Dict[str, np.ndarray]],
+    all_stats: Dict[str, Dict[str, CategoryStats]],
+    all_best_idx: Dict[str, np.ndarray],
+    all_top: Dict[str, TopMatches],
+    dim2passages: Dict[str, Dict[str, str]],
+    cross_encoder: Any,
+    margin_band: float = 0.05,
+    max_rows: int = 1000,
+    batch_size: int = 32,
+) -> Dict[str, int]:
+    """
+    Re-rank with a cross-encoder only the borderline rows of each dimension.
+
+    all_top holds the top_k active categories of the assigned rows, as
+    kept by match_all_dimensions (no score is computed again here). A row
+    is borderline when the bi-encoder scores of its two best categories
+    differ by less than margin_band; categories below the similarity
+    threshold (score -inf) are never candidates, so a row only moves to
+    a category it could have matched. At most max_rows rows per dimension
+    (the smallest margins) are re-ranked, each against its top_k
+    categories, in batched cross_encoder.predict calls.
+
+    all_best_idx and all_stats are updated in place (stats keep the
+    bi-encoder score of the new assignment as mean_score).
+
+    Returns
+    -------
+    Dict[str, int]
+        Number of rows whose category changed, per dimension.
+    """
+    changed: Dict[str, int] = {}
+
+    for dim, cat_embs in dim2cat_embs.items():
+        cat2stats = all_stats.get(dim, {})
+        best_idx = all_best_idx.get(dim)
+        top = all_top.get(dim)
+        cat_names = list(cat_embs.keys())
+        changed[dim] = 0
+
+        if best_idx is None or top is None or top.scores.shape[1] < 2:
+            continue
+
+        # -inf - -inf is nan: rows with a single eligible category are never borderline
+        margins = np.nan_to_num(top.scores[:, 0] - top.scores[:, 1], nan=np.inf)
+
+        candidates = np.where(margins < margin_band)[0]
+        if candidates.size > max_rows:
+            candidates = candidates[np.argpartition(margins[candidates], max_rows - 1)[:max_rows]]
+        if candidates.size == 0:
+            continue
+
+        k = top.scores.shape[1]
+        pairs = [
+            (texts[top.rows[r]], dim2passages[dim][cat_names[c]])
+            for r in candidates
+            for c in top.cat_idx[r]
+        ]
+        ce_scores = np.asarray(
+            cross_encoder.predict(pairs, batch_size=batch_size, show_progress_bar=False)
+        ).reshape(len(candidates), k)
+        ce_scores[np.isinf(top.scores[candidates])] = -np.inf
+
+        slots = ce_scores.argmax(axis=1)
+        winners = top.cat_idx[candidates, slots]
+        rows = top.rows[candidates]
+        moved = best_idx[rows] != winners
+        changed[dim] = int(moved.sum())
+        best_idx[rows] = winners
+
+        # refresh support with the (bi-encoder) score of each final assignment
+        final_scores = top.best_scores.copy()
+        final_scores[candidates[moved]] = top.scores[candidates, slots][moved]
+        final = best_idx[top.rows]
+        counts = np.bincount(final, minlength=len(cat_names))
+        sums = np.bincount(final, weights=final_scores, minlength=len(cat_names))
+        N = len(best_idx)
+
+        for ci, name in enumerate(cat_names):
+            if name not in cat2stats:
+                continue
+            stats = cat2stats[name]
+            stats.support_count = int(counts[ci])
+            stats.support_ratio = float(counts[ci] / N) if N else 0
+            stats.mean_score = float(sums[ci] / counts[ci]) if counts[ci] else 0
+
+    return changed
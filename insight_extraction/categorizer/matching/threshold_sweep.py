@@ -0,0 +1,117 @@
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from insight_extraction.categorizer.matching.matcher import compute_best_matches
+
+
+def precompute_best_matches(
+    obs_embs: np.ndarray,
+    dim2cat_embs: Dict[str, Dict[str, np.ndarray]],
+    pooling: str = "max",
+    temperature: float = 0.05,
+) -> Dict[str, Tuple[List[str], np.ndarray, np.ndarray]]:
+    """
+    Compute best category index / score once per dimension, so that
+    many threshold combinations can be evaluated on the same arrays.
+    """
+    return {
+        dim: compute_best_matches(cat_embs, obs_embs, pooling, temperature)
+        for dim, cat_embs in dim2cat_embs.items()
+    }
+
+
+def sweep_thresholds(
+    best_matches: Dict[str, Tuple[List[str], np.ndarray, np.ndarray]],
+    similarity_thresholds: Sequence[float],
+    min_support_ratios: Sequence[float],
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Evaluate every (similarity_threshold, min_support_ratio) combination
+    on precomputed best matches.
+
+    For each category the best scores are sorted once; the support at
+    every threshold is then a single searchsorted, and the support
+    filter is a broadcast comparison over all ratios.
+
+    Returns
+    -------
+    coverage_df : pd.DataFrame
+        One row per (dimension_type, similarity_threshold, min_support_ratio)
+        with n_active_categories, assigned_count and coverage
+        (share of observations that keep a category).
+    support_df : pd.DataFrame
+        One row per (dimension_type, similarity_threshold,
+        min_support_ratio, category) with support_count, support_ratio,
+        mean_score and whether the category stays active.
+    """
+    thresholds = np.asarray(similarity_thresholds, dtype=float)
+    ratios = np.asarray(min_support_ratios, dtype=float)
+    T, S = len(thresholds), len(ratios)
+
+    coverage_parts: List[pd.DataFrame] = []
+    support_parts: List[pd.DataFrame] = []
+
+    for dim, (cat_names, best_idx, best_scores) in best_matches.items():
+        C = len(cat_names)
+        if C == 0:
+            continue
+        N = len(best_idx)
+
+        counts = np.zeros((T, C), dtype=np.int64)
+        score_sums = np.zeros((T, C), dtype=float)
+
+        for ci in range(C):
+            scores = np.sort(best_scores[best_idx == ci])
+            cumsum = np.concatenate(([0.0], np.cumsum(scores)))
+            first_kept = np.searchsorted(scores, thresholds, side="left")
+            counts[:, ci] = len(scores) - first_kept
+            score_sums[:, ci] = cumsum[-1] - cumsum[first_kept]
+
+        support_ratio = counts / N if N else np.zeros((T, C))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_score = np.where(counts > 0, score_sums / counts, 0.0)
+
+        # (T, S, C): category kept for threshold t and support ratio s
+        active = support_ratio[:, None, :] >= ratios[None, :, None]
+        assigned = (counts[:, None, :] * active).sum(axis=2)
+
+        t_grid, s_grid = np.meshgrid(thresholds, ratios, indexing="ij")
+        coverage_parts.append(pd.DataFrame({
+            "dimension_type": dim,
+            "similarity_threshold": t_grid.ravel(),
+            "min_support_ratio": s_grid.ravel(),
+            "n_active_categories": active.sum(axis=2).ravel(),
+            "assigned_count": assigned.ravel(),
+            "coverage": (assigned / N if N else np.zeros((T, S))).ravel(),
+        }))
+
+        support_parts.append(pd.DataFrame({
+            "dimension_type": dim,
+            "similarity_threshold": np.repeat(thresholds, S * C),
+            "min_support_ratio": np.tile(np.repeat(ratios, C), T),
+            "category": np.tile(np.asarray(cat_names, dtype=object), T * S),
+            "support_count": np.repeat(counts, S, axis=0).ravel(),
+            "support_ratio": np.repeat(support_ratio, S, axis=0).ravel(),
+            "mean_score": np.repeat(mean_score, S, axis=0).ravel(),
+            "active": active.ravel(),
+        }))
+
+    coverage_df = (
+        pd.concat(coverage_parts, ignore_index=True)
+        if coverage_parts else pd.DataFrame()
+    )
+    support_df = (
+        pd.concat(support_parts, ignore_index=True)
+        if support_parts else pd.DataFrame()
+    )
+    return coverage_df, support_df
+
+
+def sweep_all_dimensions(
+    obs_embs: np.ndarray,
+    dim2cat_embs: Dict[str, Dict[str, np.ndarray]],
+    similarity_thresholds: Sequence[float],
+    min_support_ratios: Sequence[float],
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    best_matches = precompute_best_matches(obs_embs, dim2cat_embs)
+    return sweep_thresholds(best_matches, similarity_thresholds, min_support_ratios)
@@ -1,6 +1,139 @@
 import json
+import threading
+from pathlib import Path
 from typing import List, Dict, Any
 
+COLUMNAR_SUFFIXES = (".parquet", ".arrow", ".feather")
+
+
 def save_assignment_json(records: List[Dict[str, Any]], output_path: str):
     with open(output_path, "w", encoding="utf-8") as f:
         json.dump(records, f, indent=2, ensure_ascii=False)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError as exc:
+        raise ImportError(
+            "Parquet/Arrow allocation files require pyarrow (pip install pyarrow)."
+        ) from exc
+    return pa
+
+
+def save_assignment_columnar(allocation: Any, output_path: str) -> None:
+    """
+    Save a CategoryAllocation as Parquet (.parquet) or Arrow IPC
+    (.arrow / .feather).
+
+    Columns: row_index, observation_date, processed_date, optional
+    observation_id / text_hash, one dictionary-encoded column per
+    dimension_type and, with assignment_scores, one "<dim>__score" float
+    column per dimension. The dimension names are stored in the schema
+    metadata.
+    """
+    pa = _import_pyarrow()
+
+    columns = {
+        "row_index": pa.array(allocation.row_index, type=pa.int64()),
+        "observation_date": pa.array(allocation.observation_date, type=pa.timestamp("us")),
+        "processed_date": pa.array(allocation.processed_date, type=pa.timestamp("us")),
+    }
+    if allocation.observation_id is not None:
+        columns["observation_id"] = pa.array(allocation.observation_id.astype(str))
+    if allocation.text_hash is not None:
+        columns["text_hash"] = pa.array(allocation.text_hash, type=pa.string())
+    for dim, categories in allocation.assignments.items():
+        columns[dim] = pa.array(categories, type=pa.string()).dictionary_encode()
+    scores = allocation.assignment_scores or {}
+    for dim, values in scores.items():
+        columns[f"{dim}__score"] = pa.array(values, type=pa.float64())
+
+    metadata = {"dimensions": json.dumps(list(allocation.assignments.keys()))}
+    if allocation.assignment_scores is not None:
+        metadata["score_dimensions"] = json.dumps(list(scores.keys()))
+    table = pa.table(columns).replace_schema_metadata(metadata)
+
+    if Path(output_path).suffix == ".parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, output_path)
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, output_path)
+
+
+def load_assignment_columnar(input_path: str) -> Any:
+    """
+    Read a Parquet / Arrow IPC allocation back into a CategoryAllocation.
+    """
+    import numpy as np
+    from insight_extraction.categorizer.allocation import CategoryAllocation
+
+    _import_pyarrow()
+    if Path(input_path).suffix == ".parquet":
+        import pyarrow.parquet as pq
+        table = pq.read_table(input_path)
+    else:
+        import pyarrow.feather as feather
+        table = feather.read_table(input_path)
+
+    metadata = table.schema.metadata or {}
+    dims = json.loads(metadata.get(b"dimensions", b"[]"))
+
+    assignments = {}
+    for dim in dims:
+        col = table.column(dim).combine_chunks()
+        if not hasattr(col, "indices"):
+            col = col.dictionary_encode()
+        # null index -> trailing None of the lookup
+        lookup = np.append(np.asarray(col.dictionary.to_pylist(), dtype=object), None)
+        codes = col.indices.fill_null(len(lookup) - 1).to_numpy()
+        assignments[dim] = lookup[codes]
+
+    observation_id = None
+    if "observation_id" in table.column_names:
+        observation_id = np.asarray(table.column("observation_id").to_pylist(), dtype=object)
+    text_hash = None
+    if "text_hash" in table.column_names:
+        text_hash = np.asarray(table.column("text_hash").to_pylist(), dtype=object)
+    assignment_scores = None
+    if b"score_dimensions" in metadata:
+        assignment_scores = {
+            dim: table.column(f"{dim}__score").to_numpy()
+            for dim in json.loads(metadata[b"score_dimensions"])
+        }
+
+    return CategoryAllocation(
+        row_index=table.column("row_index").to_numpy(),
+        observation_date=table.column("observation_date").to_numpy().astype("datetime64[us]"),
+        processed_date=table.column("processed_date").to_numpy().astype("datetime64[us]"),
+        assignments=assignments,
+        observation_id=observation_id,
+        text_hash=text_hash,
+        assignment_scores=assignment_scores,
+    )
+
+
+def save_allocation(allocation: Any, output_path: str) -> None:
+    """
+    Save a CategoryAllocation in the format given by the file suffix:
+    JSON records (.json) or columnar (.parquet / .arrow / .feather).
+    """
+    if Path(output_path).suffix in COLUMNAR_SUFFIXES:
+        save_assignment_columnar(allocation, output_path)
+    else:
+        save_assignment_json(allocation.to_records(), output_path)
+
+
+def save_allocation_async(allocation: Any, output_path: str) -> threading.Thread:
+    """
+    Same as save_allocation, in a background (non-daemon) thread, off
+    the critical path.
+    """
+    thread = threading.Thread(
+        target=save_allocation,
+        args=(allocation, output_path),
+        name=f"save-allocation-{output_path}",
+    )
+    thread.start()
+    return thread
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+_EQUALITY_OPS = {"=": True, "==": True, "!=": False, "<>": False}
+_LIST_OPS = {"IN": True, "NOT IN": False}
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    if value in (None, ""):
+        return None
+    return date.fromisoformat(str(value)[:10])
+
+
+def time_window_mask(
+    dates: pd.Series,
+    time_spec: Dict[str, Any],
+) -> Tuple[Optional[np.ndarray], List[str]]:
+    """
+    Rows of `dates` inside intent["time"], with the semantics of the
+    generated SQL (sql_compiler): year / month on the date, "from"
+    inclusive, "to" inclusive of the whole day. Rows without a date are
+    out of any window.
+
+    Returns (mask or None when there is no window, applied predicates).
+    Raises ValueError on values that cannot be parsed.
+    """
+    dates = pd.to_datetime(dates, errors="coerce")
+    mask = np.ones(len(dates), dtype=bool)
+    applied: List[str] = []
+
+    year = time_spec.get("year")
+    month = time_spec.get("month")
+    date_start = _parse_date(time_spec.get("from"))
+    date_end = _parse_date(time_spec.get("to"))
+
+    if year not in (None, ""):
+        mask &= (dates.dt.year == int(year)).to_numpy()
+        applied.append(f"year = {int(year)}")
+    if month not in (None, ""):
+        mask &= (dates.dt.month == int(month)).to_numpy()
+        applied.append(f"month = {int(month)}")
+    if date_start is not None:
+        mask &= (dates >= pd.Timestamp(date_start)).to_numpy()
+        applied.append(f"date >= {date_start.isoformat()}")
+    if date_end is not None:
+        mask &= (dates < pd.Timestamp(date_end + timedelta(days=1))).to_numpy()
+        applied.append(f"date <= {date_end.isoformat()}")
+
+    return (mask if applied else None), applied
+
+
+def column_filter_mask(
+    df: pd.DataFrame,
+    filters: List[Dict[str, Any]],
+    exclude: Tuple[str, ...] = (),
+) -> Tuple[Optional[np.ndarray], List[str]]:
+    """
+    Rows of df passing the intent filters that name a column of df
+    (dimension_type matched case-insensitively) with =, !=, IN or
+    NOT IN; values are compared as trimmed, case-folded strings.
+
+    Filters on dimensions that only exist after categorization (or are
+    categorized anyway, `exclude`), or with other operators, are left to
+    the SQL stage.
+    """
+    excluded = {str(d).lower() for d in exclude}
+    columns = {str(c).lower(): c for c in df.columns if str(c).lower() not in excluded}
+    mask = np.ones(len(df), dtype=bool)
+    applied: List[str] = []
+
+    for flt in filters or []:
+        col = columns.get(str(flt.get("dimension_type", "")).lower())
+        op = str(flt.get("operator", "=")).strip().upper()
+        value = flt.get("value")
+        if col is None or value in (None, "") or (op not in _EQUALITY_OPS and op not in _LIST_OPS):
+            continue
+
+        if op in _LIST_OPS:
+            values = value if isinstance(value, list) else str(value).split(",")
+            keep = _LIST_OPS[op]
+        else:
+            values = [value]
+            keep = _EQUALITY_OPS[op]
+        values = {str(v).strip().casefold() for v in values if str(v).strip()}
+        if not values:
+            continue
+
+        raw = df[col]
+        matches = raw.astype(str).str.strip().str.casefold().isin(values).to_numpy()
+        # a missing value is neither equal nor different (SQL NULL)
+        mask &= (matches if keep else ~matches) & raw.notna().to_numpy()
+        applied.append(f"{col} {op} {sorted(values)}")
+
+    return (mask if applied else None), applied
+
+
+def intent_row_positions(
+    df: pd.DataFrame,
+    intent: Dict[str, Any],
+    date_col: str,
+    column_filters: bool = True,
+) -> Tuple[Optional[np.ndarray], List[str]]:
+    """
+    Positions of the rows of df the intent can be about: inside its time
+    window and, with column_filters, passing its filters on raw columns
+    that are not among its group_by dimensions (see time_window_mask and
+    column_filter_mask).
+    None when nothing could be pushed down
+    (no window, no applicable filter, or unparsable time values).
+    """
+    masks: List[np.ndarray] = []
+    applied: List[str] = []
+    try:
+        time_mask, time_applied = time_window_mask(df[date_col], intent.get("time") or {})
+    except (TypeError, ValueError):
+        time_mask, time_applied = None, []
+    group_dims = tuple(
+        str(g.get("dimension_type") or "") for g in intent.get("group_by") or []
+    )
+    filter_mask, filter_applied = column_filter_mask(
+        df, (intent.get("filters") or []) if column_filters else [], exclude=group_dims
+    )
+
+    for mask, names in ((time_mask, time_applied), (filter_mask, filter_applied)):
+        if mask is not None:
+            masks.append(mask)
+            applied.extend(names)
+    if not masks:
+        return None, []
+    return np.flatnonzero(np.logical_and.reduce(masks)), applied
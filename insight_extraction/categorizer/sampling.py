@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class SampleDesign:
+    """
+    Stratified sample of the observations, one stratum per month of the
+    observation date (rows without a date form their own stratum).
+
+    strata : "YYYY-MM" (or "NaT") -> (rows in the population, rows sampled).
+    The allocation is proportional, so every row has (up to rounding)
+    the same inclusion probability `fraction` and counts on the sample
+    scale to the population by population_size / sample_size.
+    """
+    population_size: int
+    sample_size: int
+    strata: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+
+    @property
+    def fraction(self) -> float:
+        return self.sample_size / self.population_size if self.population_size else 0.0
+
+    @property
+    def scale(self) -> float:
+        return self.population_size / self.sample_size if self.sample_size else 0.0
+
+
+def stratified_sample(
+    df: pd.DataFrame,
+    date_col: str,
+    fraction: float,
+    min_per_stratum: int = 1,
+    random_state: Optional[int] = 0,
+) -> Tuple[np.ndarray, SampleDesign]:
+    """
+    Proportional stratified sample of df by month of date_col: each
+    month keeps round(fraction * rows) rows, at least min_per_stratum
+    (and at most all of them), drawn without replacement.
+
+    Returns the sorted row positions of the sample and its SampleDesign.
+    """
+    if not 0 < fraction <= 1:
+        raise ValueError(f"fraction must be in (0, 1], got {fraction}")
+
+    rng = np.random.default_rng(random_state)
+    months = pd.to_datetime(df[date_col], errors="coerce").dt.strftime("%Y-%m")
+    codes, labels = pd.factorize(months.fillna("NaT"), sort=True)
+
+    positions = []
+    strata: Dict[str, Tuple[int, int]] = {}
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+    for h, label in enumerate(labels):
+        members = order[bounds[h]:bounds[h + 1]]
+        n_h = min(len(members), max(min_per_stratum, int(round(fraction * len(members)))))
+        positions.append(rng.choice(members, size=n_h, replace=False))
+        strata[str(label)] = (len(members), n_h)
+
+    positions = np.sort(np.concatenate(positions)) if positions else np.array([], dtype=np.int64)
+    design = SampleDesign(
+        population_size=len(df),
+        sample_size=len(positions),
+        strata=strata,
+    )
+    return positions.astype(np.int64), design
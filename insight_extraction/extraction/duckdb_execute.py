@@ -0,0 +1,311 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from insight_extraction.extraction.sql_execute import (
+    DEFAULT_LIMITS,
+    QueryLimits,
+    _build_result_frame,
+    _cached_payload,
+    _collect_result,
+    parse_llm_sql_response,
+)
+from insight_extraction.extraction.table_creator import (
+    METADATA_TABLE,
+    ROLLUP_MEASURES,
+    ROLLUP_TABLE,
+    TIME_COLUMNS,
+    dataframe_content_hash,
+    rollup_columns,
+)
+
+
+def _import_duckdb():
+    try:
+        import duckdb
+    except ImportError as exc:
+        raise ImportError(
+            "The DuckDB backend requires duckdb (pip install duckdb)."
+        ) from exc
+    return duckdb
+
+
+def _file_content_hash(path: Path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def open_duckdb(
+    source: pd.DataFrame | str | Path,
+    table_name: str = "observations_enriched",
+    rollup_name: Optional[str] = ROLLUP_TABLE,
+    dimension_cols: Optional[List[str]] = None,
+) -> Any:
+    """
+    In-process DuckDB database holding the analytics table, loaded from
+    the DataFrame built by build_analytics_dataframe or from a Parquet
+    file of it.
+
+    Categorical columns are stored as VARCHAR (not ENUM), so filters on
+    values missing from the data do not fail. As with
+    save_dataframe_to_sqlite, the rollup table is built when the table
+    has processing_time_days, and the row count / content hash is
+    recorded in METADATA_TABLE for result_cache.
+
+    dimension_cols : rollup dimensions, defaults to the categorical
+        columns of the DataFrame (dictionary-encoded ones in Parquet).
+    """
+    duckdb = _import_duckdb()
+    conn = duckdb.connect()
+
+    if isinstance(source, pd.DataFrame):
+        conn.register("_source_frame", source)
+        relation = "_source_frame"
+        content_hash = dataframe_content_hash(source)
+    else:
+        path = Path(source)
+        if path.suffix != ".parquet":
+            raise ValueError(f"Unsupported DuckDB source: {path} (expected .parquet)")
+        relation = f"read_parquet('{path.as_posix()}')"
+        content_hash = _file_content_hash(path)
+        if dimension_cols is None:
+            # categorical columns are written as dictionary-encoded fields
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            dimension_cols = [
+                field.name for field in pq.read_schema(path)
+                if pa.types.is_dictionary(field.type)
+            ]
+
+    columns = conn.execute(f"DESCRIBE SELECT * FROM {relation}").fetchall()
+    select = ", ".join(
+        f'CAST("{name}" AS VARCHAR) AS "{name}"' if col_type.startswith("ENUM")
+        else f'"{name}"'
+        for name, col_type, *_ in columns
+    )
+    conn.execute(f'CREATE TABLE "{table_name}" AS SELECT {select} FROM {relation}')
+    if isinstance(source, pd.DataFrame):
+        conn.unregister("_source_frame")
+
+    col_names = [c[0] for c in columns]
+    if rollup_name is not None and "processing_time_days" in col_names:
+        dims = dimension_cols
+        if dims is None:
+            dims = [name for name, col_type, *_ in columns if col_type.startswith("ENUM")]
+        header = pd.DataFrame(columns=col_names)
+        group_cols = rollup_columns(header, dims)[: -len(ROLLUP_MEASURES)]
+        keys_sql = ", ".join(f'"{c}"' for c in group_cols)
+        select_keys = f"{keys_sql}, " if group_cols else ""
+        group_by = f" GROUP BY {keys_sql}" if group_cols else ""
+        conn.execute(
+            f'CREATE TABLE "{rollup_name}" AS SELECT {select_keys}'
+            f"COUNT(*) AS n_observations, "
+            f"SUM(processing_time_days) AS sum_processing_time_days, "
+            f"COUNT(processing_time_days) AS count_processing_time_days "
+            f'FROM "{table_name}"{group_by}'
+        )
+
+    # same layout as table_creator._record_table_fingerprint; the "duckdb:"
+    # prefix keeps cached results of the two backends apart
+    row_count = conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+    conn.execute(
+        f'CREATE TABLE "{METADATA_TABLE}" ('
+        "table_name TEXT PRIMARY KEY, row_count INTEGER, "
+        "content_hash TEXT, loaded_at TEXT)"
+    )
+    conn.execute(
+        f'INSERT INTO "{METADATA_TABLE}" VALUES (?, ?, ?, CAST(now() AS TEXT))',
+        (table_name, row_count, f"duckdb:{content_hash}"),
+    )
+    return conn
+
+
+def open_duckdb_from_sqlite(
+    db_path: Optional[str],
+    conn: Optional[sqlite3.Connection] = None,
+    table_name: str = "observations_enriched",
+    rollup_name: Optional[str] = ROLLUP_TABLE,
+) -> Any:
+    """
+    open_duckdb on a copy of table_name read from SQLite (conn, or the
+    db_path file). Dates come back as text; pass the DataFrame or a
+    Parquet file to open_duckdb when available.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(db_path)
+    try:
+        df = pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn)
+        # the dimensions are the keys of the SQLite rollup, if any
+        rollup_keys = [
+            r[1] for r in conn.execute(f'PRAGMA table_info("{rollup_name}")')
+        ] if rollup_name is not None else []
+    finally:
+        if own_conn:
+            conn.close()
+    dims = [c for c in rollup_keys if c not in ROLLUP_MEASURES and c not in TIME_COLUMNS]
+    for col in TIME_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("Int64")
+    return open_duckdb(
+        df, table_name=table_name, rollup_name=rollup_name if rollup_keys else None,
+        dimension_cols=dims,
+    )
+
+
+def validate_sql_duckdb(conn: Any, sql: str) -> Optional[str]:
+    """
+    sql_validate.validate_sql for a DuckDB connection: one read-only
+    SELECT / WITH statement that DuckDB can plan (EXPLAIN).
+    """
+    duckdb = _import_duckdb()
+    try:
+        statements = conn.extract_statements(sql)
+    except duckdb.Error as exc:
+        return str(exc)
+    if len(statements) != 1:
+        return "You can only execute one statement at a time."
+    if statements[0].type != duckdb.StatementType.SELECT:
+        return "only SELECT / WITH ... SELECT statements are allowed"
+
+    try:
+        conn.execute(f"EXPLAIN {sql}").fetchall()
+    except duckdb.Error as exc:
+        return str(exc)
+    return None
+
+
+def _plain_numeric(column: Any) -> Any:
+    """
+    DECIMAL columns (SUM of integers, numeric literals) as int64 / float64,
+    the types SQLite returns, instead of decimal.Decimal objects.
+    """
+    import pyarrow as pa
+    if not pa.types.is_decimal(column.type):
+        return column
+    return column.cast(pa.int64() if column.type.scale == 0 else pa.float64())
+
+
+def _plan_operators(nodes: List[Dict[str, Any]]) -> List[str]:
+    """
+    Operator names of an EXPLAIN (FORMAT JSON) plan, bottom-up, one per
+    line like the SQLite EXPLAIN QUERY PLAN details; scans name their
+    table and the column-shuffling PROJECTION nodes are left out.
+    """
+    operators: List[str] = []
+    for node in nodes:
+        operators.extend(_plan_operators(node.get("children", [])))
+        if node["name"] == "PROJECTION":
+            continue
+        table = (node.get("extra_info") or {}).get("Table")
+        operators.append(f"{node['name']} {table}" if table else node["name"])
+    return operators
+
+
+def _execute_labelled_query_duckdb(
+    conn: Any,
+    sql: str,
+    limits: Optional[QueryLimits] = None,
+    profile: bool = False,
+) -> Dict[str, Any]:
+    """
+    DuckDB counterpart of sql_execute._execute_labelled_query, same
+    payload. Results are streamed as Arrow record batches of
+    limits.fetch_size rows, up to limits.max_rows; limits.timeout_s
+    interrupts the connection. The profile has no VM steps (vm_steps
+    None) and the operators of the physical plan (_plan_operators).
+    """
+    duckdb = _import_duckdb()
+    limits = limits or DEFAULT_LIMITS
+
+    timer = None
+    timed_out = threading.Event()
+    if limits.timeout_s is not None:
+        def on_timeout() -> None:
+            timed_out.set()
+            conn.interrupt()
+        timer = threading.Timer(limits.timeout_s, on_timeout)
+        timer.start()
+
+    payload: Dict[str, Any]
+    start = time.perf_counter()
+    try:
+        reader = conn.execute(sql).fetch_record_batch(limits.fetch_size)
+        col_names: List[str] = list(reader.schema.names)
+        buffers: List[List[Any]] = [[] for _ in col_names]
+        n_rows = 0
+        truncated = False
+
+        for batch in reader:
+            if limits.max_rows is not None and n_rows + batch.num_rows > limits.max_rows:
+                batch = batch.slice(0, limits.max_rows - n_rows)
+                truncated = True
+            for buffer, column in zip(buffers, batch.columns):
+                buffer.extend(_plain_numeric(column).to_pylist())
+            n_rows += batch.num_rows
+            if truncated:
+                break
+        payload = {
+            "sql": sql,
+            "columns": col_names,
+            "frame": _build_result_frame(col_names, buffers),
+            "n_rows": n_rows,
+            "truncated": truncated,
+        }
+    except duckdb.Error as exc:
+        if timed_out.is_set():
+            payload = {"sql": sql, "error": f"timed out after {limits.timeout_s}s"}
+        else:
+            payload = {"sql": sql, "error": str(exc)}
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+    if profile:
+        elapsed = time.perf_counter() - start
+        try:
+            _, plan_json = conn.execute(f"EXPLAIN (FORMAT JSON) {sql}").fetchone()
+            plan = _plan_operators(json.loads(plan_json))
+        except duckdb.Error:
+            plan = []
+        payload["profile"] = {"elapsed_s": elapsed, "vm_steps": None, "plan": plan}
+
+    return payload
+
+
+def execute_sql_on_duckdb(
+    conn: Any,
+    sql_response: str,
+    cache: Optional[Any] = None,
+    limits: Optional[QueryLimits] = None,
+    profiler: Optional[Any] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Same as execute_sql_on_sqlite, on a DuckDB connection from
+    open_duckdb: same labelled blocks, logs, cache, limits, profiler and
+    result dict. The queries run one after the other, DuckDB already
+    spreads each of them over all cores.
+    """
+    queries = parse_llm_sql_response(sql_response)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    fingerprint = cache.fingerprint(conn) if cache is not None else None
+    for key, sql in queries.items():
+        payload = _cached_payload(cache, fingerprint, sql)
+        if payload is None:
+            payload = _execute_labelled_query_duckdb(conn, sql, limits, profiler is not None)
+            if cache is not None and "error" not in payload:
+                cache.put(sql, fingerprint, payload)
+        _collect_result(results, key, payload, profiler)
+
+    return results
@@ -1,39 +1,235 @@
+from typing import Optional
 from insight_extraction.extraction.table_creator import *
 from insight_extraction.extraction.sql_execute import *
 from insight_extraction.extraction.sql_generate import SQLQueryGenerator
-from insight_extraction.utils.saving_scripts import save_sql_results_to_csv
+from insight_extraction.extraction.duckdb_execute import (
+    execute_sql_on_duckdb,
+    open_duckdb,
+    open_duckdb_from_sqlite,
+    validate_sql_duckdb,
+)
+from insight_extraction.extraction.index_advisor import (
+    advise_indexes,
+    print_index_report,
+    record_execution_times,
+)
+from insight_extraction.extraction.result_cache import ResultCache
+from insight_extraction.extraction.query_profiler import QueryProfiler
+from insight_extraction.extraction.preview import scale_preview_results
+from insight_extraction.extraction.sql_validate import (
+    format_labelled_sql,
+    repair_queries,
+    schema_summary,
+    start_repairs,
+    validate_queries,
+    validate_sql,
+)
+from insight_extraction.utils.saving_scripts import InsightFrames, save_sql_results
 
 def define_queries(llm_client: Any,
-                   allocation_path: str, 
+                   allocation_path: Optional[str], 
                    user_prompt: str, 
                    intent: Dict[str, Any],
-                   db_path: str, 
-                   csv_path: str, 
+                   db_path: Optional[str], 
+                   csv_path: Optional[str] = None, 
+                   allocation: Optional[CategoryAllocation] = None,
+                   conn: Optional[sqlite3.Connection] = None,
+                   parquet_path: Optional[str] = None,
+                   sql_dialect: str = "SQLite",
+                   backend: str = "sqlite",
                    ) -> None:
-    
-    assignments = load_assignments(allocation_path)
-    df = build_analytics_dataframe(assignments)
+    """
+    Build the analytics table and ask the LLM for the SQL queries.
+
+    With conn (e.g. open_memory_db()) the table is loaded into that
+    connection, which stays open for extract_insights; db_path is then
+    only a persistence target (backup API) and can be None.
+    The CSV copy is written only when csv_path is given, the Parquet
+    one (source of the DuckDB backend of extract_insights) only when
+    parquet_path is given. sql_dialect is the dialect asked to the LLM.
+
+    With backend="duckdb" and a parquet_path (the source extract_insights
+    reads), the SQLite load (rollup, indexes, ANALYZE) is skipped unless
+    db_path asks for a copy on disk.
+    """
+    load_sqlite = not (
+        backend == "duckdb" and parquet_path is not None and db_path is None
+    )
+    if load_sqlite and conn is None and db_path is None:
+        raise ValueError("Either db_path or conn is required.")
+
+    # in-memory hand-off from run_pipeline: no JSON round-trip
+    if allocation is not None:
+        df = build_analytics_dataframe(allocation)
+    else:
+        assignments = load_assignments(allocation_path)
+        df = build_analytics_dataframe(assignments)
+
+    if load_sqlite and conn is not None:
+        save_dataframe_to_sqlite(df, None, conn=conn)
+        if db_path is not None:
+            persist_sqlite(conn, db_path)
+    elif load_sqlite:
+        save_dataframe_to_sqlite(df, db_path)
 
-    save_dataframe_to_sqlite(df, db_path)
-    save_dataframe_to_csv(df, csv_path)
+    if csv_path is not None:
+        save_dataframe_to_csv(df, csv_path)
+    if parquet_path is not None:
+        df.to_parquet(parquet_path, index=False)
     
 
     # Example schema (you can adapt it to data_en)
     schema_text = df.columns.tolist()
+    rollup_schema = rollup_columns(df) if "processing_time_days" in df.columns else None
 
-    generator = SQLQueryGenerator(llm_client=llm_client, sql_dialect="SQLite")
+    generator = SQLQueryGenerator(llm_client=llm_client, sql_dialect=sql_dialect)
 
     sql_code = generator.generate_sql(
         user_question=user_prompt,
         json_spec=intent,
         main_table="observations_enriched",  # TODO: adapt with dynamic name
         schema_text=schema_text,
-
+        rollup_table=ROLLUP_TABLE if rollup_schema else None,
+        rollup_schema=rollup_schema,
+        categories=dimension_categories(df),
     )
 
     return sql_code
 
-def extract_insights(db_path: str, sql_code: str, output_dir: str) -> None:
-    exec_results = execute_sql_on_sqlite(db_path=db_path, sql_response=sql_code)
-    
-    return save_sql_results_to_csv(exec_results, output_dir=output_dir)
+def extract_insights(db_path: Optional[str], 
+                     sql_code: str, 
+                     output_dir: str,
+                     auto_index: bool = True,
+                     measure_indexes: bool = True,
+                     conn: Optional[sqlite3.Connection] = None,
+                     max_workers: int = 4,
+                     cache: Optional[ResultCache] = None,
+                     limits: Optional[QueryLimits] = None,
+                     profile_path: Optional[str] = None,
+                     generator: Optional[SQLQueryGenerator] = None,
+                     main_table: str = "observations_enriched",
+                     max_repairs: int = 1,
+                     backend: str = "sqlite",
+                     duckdb_source: Optional[Any] = None,
+                     save_format: str = "csv",
+                     async_save: bool = False,
+                     sample_design: Optional[Any] = None,
+                     confidence: float = 0.95,
+                     ) -> InsightFrames:
+    """
+    Validate, (repair,) run and save the labelled queries of sql_code.
+
+    backend : "sqlite" runs them on conn / db_path; "duckdb" on an
+        in-process DuckDB copy of the table, loaded from duckdb_source
+        (the analytics DataFrame or its Parquet file, see define_queries)
+        or else from the SQLite table. Same results and cache either way;
+        the index advisor only applies to SQLite.
+    measure_indexes : run the indexed queries once before indexing, so
+        the index report can set the indexing time against the query time
+        saved, measured on the real execution
+        (index_advisor.record_execution_times).
+
+    Returns the result DataFrames by query key, to be passed on to the
+    downstream stages as they are; each one is also written to
+    output_dir as save_format ("csv" / "parquet"), in the background
+    with async_save (InsightFrames.wait_for_persistence).
+
+    sample_design : the allocation.sample_design of a preview run; the
+        counts and shares of every result then get population estimates
+        and confidence intervals at the given level (preview.scale_preview_frame).
+    """
+    if backend not in ("sqlite", "duckdb"):
+        raise ValueError(f"Unknown backend: {backend}")
+
+    if backend == "duckdb":
+        check_conn = (
+            open_duckdb(duckdb_source) if duckdb_source is not None
+            else open_duckdb_from_sqlite(db_path, conn=conn)
+        )
+        validator = validate_sql_duckdb
+    else:
+        check_conn = conn if conn is not None else sqlite3.connect(db_path)
+        validator = validate_sql
+
+    def run_queries(code: str) -> Dict[str, Dict[str, Any]]:
+        if backend == "duckdb":
+            return execute_sql_on_duckdb(
+                check_conn, code, cache=cache, limits=limits, profiler=profiler,
+            )
+        # labelled queries run concurrently on read-only connections
+        return execute_sql_parallel(
+            db_path=db_path, sql_response=code, conn=conn, max_workers=max_workers,
+            cache=cache, limits=limits, profiler=profiler,
+        )
+
+    repair_pool, pending = None, None
+    index_reports = []
+    # pre-flight validation: EXPLAIN every block against the real schema
+    try:
+        queries = parse_llm_sql_response(sql_code)
+        valid, invalid = validate_queries(check_conn, queries, validator)
+        for key, (sql, error) in invalid.items():
+            print(f"⚠️ {key} is not valid ({error})\n")
+
+        # only the failing blocks go back to the LLM, while the valid ones run
+        if invalid and generator is not None:
+            repair_pool, pending = start_repairs(
+                generator, invalid, schema_summary(check_conn), main_table
+            )
+
+        valid_code = format_labelled_sql(valid)
+
+        # covering indexes for the queries that would fully scan a large table
+        if auto_index and backend == "sqlite":
+            index_reports = advise_indexes(
+                db_path, valid_code, measure=measure_indexes, conn=conn, time_after=False,
+            )
+
+        # per-query time / rows / VM steps / plan, written to profile_path;
+        # also the query times after indexing of the index report
+        profiler = (
+            QueryProfiler()
+            if profile_path is not None or any(r.used for r in index_reports)
+            else None
+        )
+
+        exec_results = run_queries(valid_code)
+
+        if pending is not None:
+            repaired, still_invalid = repair_queries(
+                check_conn, generator, invalid, main_table, max_repairs, pending,
+                validator,
+            )
+            for key in still_invalid:
+                print(f"⚠️ {key} could not be repaired. Skipping it.\n")
+            if repaired:
+                exec_results.update(run_queries(format_labelled_sql(repaired)))
+            # keep the order of the labelled blocks
+            exec_results = {k: exec_results[k] for k in queries if k in exec_results}
+    finally:
+        if repair_pool is not None:
+            # on errors, the LLM calls not started yet are dropped
+            repair_pool.shutdown(cancel_futures=True)
+        if check_conn is not conn:
+            check_conn.close()
+
+    if auto_index and backend == "sqlite":
+        if profiler is not None:
+            record_execution_times(index_reports, profiler.profiles)
+        print_index_report(index_reports)
+    if profile_path is not None:
+        profiler.print_report()
+        print(f">>> Query profile saved to: {profiler.write_report(profile_path)}\n")
+    if cache is not None:
+        print(f">>> Query cache: {cache.hits} hit(s), {cache.misses} miss(es)\n")
+
+    if sample_design is not None:
+        print(
+            f">>> Preview on {sample_design.sample_size}/{sample_design.population_size} rows: "
+            f"counts scaled x{sample_design.scale:.2f}, {confidence:.0%} confidence intervals\n"
+        )
+        exec_results = scale_preview_results(exec_results, sample_design, confidence)
+
+    return save_sql_results(
+        exec_results, output_dir=output_dir, fmt=save_format, async_save=async_save
+    )
@@ -0,0 +1,334 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import re
+import sqlite3
+import time
+
+from insight_extraction.extraction.query_profiler import QueryProfile
+from insight_extraction.extraction.sql_execute import parse_llm_sql_response
+
+
+@dataclass
+class IndexReport:
+    query_key: str
+    table: str
+    columns: List[str]
+    index_name: Optional[str]
+    index_time: float
+    query_time_before: Optional[float]   # None when not measured
+    query_time_after: Optional[float]
+    used: bool
+    vm_steps_before: Optional[int] = None
+
+    @property
+    def time_saved(self) -> Optional[float]:
+        if self.query_time_before is None or self.query_time_after is None:
+            return None
+        return self.query_time_before - self.query_time_after
+
+
+_TOKEN_RE = re.compile(
+    r"'(?:[^']|'')*'"             # string literal (ignored)
+    r'|"([^"]+)"'                  # quoted identifier
+    r"|([A-Za-z_][A-Za-z0-9_]*)"   # word
+    r"|(<=|>=|<>|!=|[=<>(),.])"    # operators / punctuation
+)
+
+_CLAUSE_WORDS = {
+    "SELECT": "select", "FROM": "from", "JOIN": "from", "ON": "where",
+    "WHERE": "where", "GROUP": "group_by", "HAVING": "having",
+    "ORDER": "order_by", "LIMIT": "limit", "UNION": "select",
+}
+
+_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)(.*)$")
+
+
+def _tokens(sql: str) -> List[Tuple[str, str]]:
+    """
+    ("ident" | "word" | "op", text) tokens; string literals are dropped.
+    """
+    out = []
+    for m in _TOKEN_RE.finditer(sql):
+        quoted, word, op = m.groups()
+        if quoted is not None:
+            out.append(("ident", quoted))
+        elif word is not None:
+            out.append(("word", word))
+        elif op is not None:
+            out.append(("op", op))
+    return out
+
+
+def extract_clause_columns(sql: str, table_columns: List[str]) -> Dict[str, List[str]]:
+    """
+    Columns of table_columns referenced by the query, per clause.
+
+    Returns a dict with keys "equality" (WHERE/ON columns compared with
+    = or IN), "range" (other WHERE/ON columns), "group_by", "order_by"
+    and "other" (SELECT list, HAVING...). Subqueries are handled with a
+    clause stack on the parentheses; the matching is by column name, so
+    it is a heuristic and never fails on unusual SQL.
+    """
+    known = {c.lower(): c for c in table_columns}
+    found: Dict[str, List[str]] = {
+        "equality": [], "range": [], "group_by": [], "order_by": [], "other": [],
+    }
+
+    tokens = _tokens(sql)
+    clause = "select"
+    stack: List[str] = []
+
+    for i, (kind, text) in enumerate(tokens):
+        if kind == "op":
+            if text == "(":
+                stack.append(clause)
+            elif text == ")" and stack:
+                clause = stack.pop()
+            continue
+
+        upper = text.upper()
+        if kind == "word" and upper in _CLAUSE_WORDS:
+            clause = _CLAUSE_WORDS[upper]
+            continue
+
+        col = known.get(text.lower())
+        if col is None:
+            continue
+        # qualified "alias.col": the alias itself is not a column
+        if i + 1 < len(tokens) and tokens[i + 1] == ("op", "."):
+            continue
+
+        if clause == "where":
+            nxt = tokens[i + 1][1].upper() if i + 1 < len(tokens) else ""
+            bucket = "equality" if nxt in ("=", "IN") else "range"
+        elif clause in ("group_by", "order_by"):
+            bucket = clause
+        elif clause == "from":
+            continue
+        else:
+            bucket = "other"
+
+        if col not in found[bucket]:
+            found[bucket].append(col)
+
+    return found
+
+
+def _table_aliases(sql: str) -> Dict[str, str]:
+    """
+    alias (or name) -> table name, from the FROM / JOIN clauses.
+    """
+    aliases: Dict[str, str] = {}
+    pattern = re.compile(
+        r'\b(?:FROM|JOIN)\s+"?(\w+)"?(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE
+    )
+    for table, alias in pattern.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in _CLAUSE_WORDS and alias.upper() not in (
+            "LEFT", "RIGHT", "INNER", "OUTER", "CROSS", "NATURAL", "USING",
+        ):
+            aliases[alias] = table
+    return aliases
+
+
+def _full_scans(conn: sqlite3.Connection, sql: str) -> List[str]:
+    """
+    Names (or aliases) of the tables fully scanned in the query plan.
+    """
+    scans = []
+    for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}"):
+        m = _SCAN_RE.match(row[-1])
+        # a covering index scan never touches the table rows
+        if m and "COVERING INDEX" not in m.group(2):
+            scans.append(m.group(1))
+    return scans
+
+
+def _existing_indexes(conn: sqlite3.Connection, table: str) -> List[List[str]]:
+    indexes = []
+    for row in conn.execute(f'PRAGMA index_list("{table}")'):
+        cols = [r[2] for r in conn.execute(f'PRAGMA index_info("{row[1]}")')]
+        indexes.append(cols)
+    return indexes
+
+
+def _time_query(
+    conn: sqlite3.Connection, sql: str, progress_steps: int = 1_000
+) -> Tuple[float, int]:
+    """
+    Run the query once; returns its time and VM steps (counted by the
+    progress handler every progress_steps instructions).
+    """
+    n_calls = 0
+
+    def on_progress() -> bool:
+        nonlocal n_calls
+        n_calls += 1
+        return False
+
+    conn.set_progress_handler(on_progress, progress_steps)
+    start = time.perf_counter()
+    try:
+        conn.execute(sql).fetchall()
+    finally:
+        conn.set_progress_handler(None, 0)
+    return time.perf_counter() - start, n_calls * progress_steps
+
+
+def record_execution_times(
+    reports: List[IndexReport], profiles: List[QueryProfile]
+) -> None:
+    """
+    Complete the reports of advise_indexes(time_after=False) with the
+    real execution of the indexed queries (QueryProfiler.profiles).
+
+    The time after indexing is the profiled one; the time before is the
+    VM steps of the run before indexing at the speed of that execution
+    (elapsed_s / vm_steps), so both are measured under the same load,
+    e.g. the concurrent connections of execute_sql_parallel.
+    """
+    by_key = {p.query_key: p for p in profiles}
+    for r in reports:
+        p = by_key.get(r.query_key)
+        if (not r.used or r.vm_steps_before is None or r.query_time_after is not None
+                or p is None or p.elapsed_s is None or not p.vm_steps):
+            continue
+        r.query_time_after = p.elapsed_s
+        r.query_time_before = r.vm_steps_before * p.elapsed_s / p.vm_steps
+
+
+def candidate_index_columns(clauses: Dict[str, List[str]]) -> List[str]:
+    """
+    Column order of the covering index: equality filters, range filters,
+    GROUP BY, ORDER BY, then the remaining referenced columns (so the
+    query can be answered from the index alone).
+    """
+    cols: List[str] = []
+    for bucket in ("equality", "range", "group_by", "order_by", "other"):
+        for col in clauses[bucket]:
+            if col not in cols:
+                cols.append(col)
+    return cols
+
+
+def advise_indexes(
+    db_path: Optional[str],
+    sql_response: str,
+    min_rows: int = 10_000,
+    measure: bool = True,
+    conn: Optional[sqlite3.Connection] = None,
+    time_after: bool = True,
+) -> List[IndexReport]:
+    """
+    Create covering indexes for the labelled queries of an LLM response
+    that fully scan a large table.
+
+    For each query, EXPLAIN QUERY PLAN is inspected; every table scanned
+    without an index and holding at least min_rows rows gets an index on
+    the columns the query filters (WHERE/ON), groups and orders by,
+    extended with the other referenced columns. Indexes the planner then
+    ignores are dropped again.
+
+    With measure=True each affected query is timed before and after
+    indexing, so the indexing cost can be compared with the time saved.
+    With time_after=False the second run is left out and both times come
+    from the real execution of the queries (record_execution_times), so
+    only one extra run is paid per indexed query.
+
+    conn : use this open connection instead of opening db_path.
+    """
+    queries = parse_llm_sql_response(sql_response)
+    reports: List[IndexReport] = []
+
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(db_path)
+    try:
+        tables = {
+            r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+
+        for key, sql in queries.items():
+            try:
+                scans = _full_scans(conn, sql)
+            except sqlite3.Error as exc:
+                print(f"[index advisor] {key}: cannot explain query ({exc}), skipped.")
+                continue
+
+            aliases = _table_aliases(sql)
+            for scanned in dict.fromkeys(scans):
+                table = aliases.get(scanned, scanned)
+                if table not in tables:
+                    continue
+                n_rows = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                if n_rows < min_rows:
+                    continue
+
+                table_columns = [r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')]
+                clauses = extract_clause_columns(sql, table_columns)
+                if not (clauses["equality"] or clauses["range"]
+                        or clauses["group_by"] or clauses["order_by"]):
+                    continue
+                cols = candidate_index_columns(clauses)
+                if cols in _existing_indexes(conn, table):
+                    continue
+
+                before, steps_before = _time_query(conn, sql) if measure else (None, None)
+
+                index_name = f"ix_auto_{table}_{'_'.join(cols)}"[:120]
+                cols_sql = ", ".join(f'"{c}"' for c in cols)
+                start = time.perf_counter()
+                with conn:
+                    conn.execute(
+                        f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table}" ({cols_sql})'
+                    )
+                    conn.execute(f'ANALYZE "{index_name}"')
+                index_time = time.perf_counter() - start
+
+                plan = " ".join(r[-1] for r in conn.execute(f"EXPLAIN QUERY PLAN {sql}"))
+                used = index_name in plan
+                if not used:
+                    with conn:
+                        conn.execute(f'DROP INDEX "{index_name}"')
+
+                if not used:
+                    after = before
+                elif measure and time_after:
+                    after, _ = _time_query(conn, sql)
+                else:
+                    after = None
+                reports.append(IndexReport(
+                    query_key=key,
+                    table=table,
+                    columns=cols,
+                    index_name=index_name if used else None,
+                    index_time=index_time,
+                    query_time_before=before,
+                    query_time_after=after,
+                    used=used,
+                    vm_steps_before=steps_before,
+                ))
+    finally:
+        if own_conn:
+            conn.close()
+
+    return reports
+
+
+def print_index_report(reports: List[IndexReport]) -> None:
+    created = [r for r in reports if r.used]
+    if not reports:
+        print("[index advisor] no full scans on large tables.")
+        return
+
+    for r in reports:
+        status = r.index_name if r.used else "not used by the planner, dropped"
+        print(f"[index advisor] {r.query_key}: {r.table}({', '.join(r.columns)}) -> {status}")
+
+    index_time = sum(r.index_time for r in reports)
+    summary = f"[index advisor] {len(created)} index(es) created in {index_time:.3f}s"
+    saved = [r.time_saved for r in created if r.time_saved is not None]
+    if saved:
+        summary += f", query time saved {sum(saved):.3f}s"
+    print(summary)
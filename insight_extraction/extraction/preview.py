@@ -0,0 +1,180 @@
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+from statistics import NormalDist
+from typing import Any, Collection, Dict, List, Optional
+import re
+
+import numpy as np
+import pandas as pd
+
+from insight_extraction.categorizer.sampling import SampleDesign
+
+# whole name tokens (split on non-alphanumerics) of the result columns
+# holding event counts (integer dtype) or shares
+_COUNT_TOKENS = {"n", "num", "number", "cnt", "count", "counts", "total"}
+_NOT_COUNT_TOKENS = {"id", "distinct", "unique", "nunique"}
+_PERCENT_TOKENS = {"pct", "perc", "percent", "percentage"}
+_SHARE_TOKENS = _PERCENT_TOKENS | {"proportion", "share", "ratio", "fraction"}
+
+# aliases of COUNT(DISTINCT ...): not scalable by N / n
+_DISTINCT_ALIAS_RE = re.compile(
+    r"count\s*\(\s*distinct\b[^)]*\)\s+as\s+[\"'`\[]?(\w+)", re.IGNORECASE
+)
+
+
+def _name_tokens(name: Any) -> set:
+    return set(re.split(r"[^0-9a-z]+", str(name).lower())) - {""}
+
+
+def distinct_count_aliases(sql: str) -> List[str]:
+    return _DISTINCT_ALIAS_RE.findall(sql or "")
+
+
+def count_columns(frame: pd.DataFrame, exclude: Collection[str] = ()) -> List[str]:
+    excluded = {str(c).lower() for c in exclude}
+    return [
+        c for c in frame.columns
+        if _name_tokens(c) & _COUNT_TOKENS and not _name_tokens(c) & _NOT_COUNT_TOKENS
+        and str(c).lower() not in excluded
+        and pd.api.types.is_integer_dtype(frame[c])
+        and not pd.api.types.is_bool_dtype(frame[c])
+    ]
+
+
+def share_columns(frame: pd.DataFrame) -> List[str]:
+    return [
+        c for c in frame.columns
+        if _name_tokens(c) & _SHARE_TOKENS and pd.api.types.is_float_dtype(frame[c])
+    ]
+
+
+def _z_value(confidence: float) -> float:
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def scale_preview_frame(
+    frame: pd.DataFrame,
+    design: SampleDesign,
+    confidence: float = 0.95,
+    exclude: Collection[str] = (),
+) -> pd.DataFrame:
+    """
+    Population estimates for a result computed on a preview sample.
+
+    Count columns c (integer, with a name token n / num / count / total...,
+    but no id / distinct token and not in exclude) get
+    c_estimate = c * N / n with a normal confidence interval
+    (c_ci_low, c_ci_high) on the share c / n of the sample, with finite
+    population correction; the variance of simple random sampling is
+    used, so the interval is conservative for the month stratification.
+
+    Share columns (pct / proportion / share / ratio, float) need no
+    scaling (the sample is self-weighting): c_estimate is the value and
+    the interval is a Wilson score interval, on the same scale (0-100
+    for pct / perc columns, 0-1 otherwise). Its denominator is taken
+    from a count column of the same row when there is one, otherwise the
+    whole sample.
+    """
+    if design.sample_size == 0:
+        return frame
+    z = _z_value(confidence)
+    N, n = design.population_size, design.sample_size
+    fpc = 1.0 - design.fraction
+
+    out = frame.copy()
+    counts = count_columns(frame, exclude)
+    for col in counts:
+        c = frame[col].to_numpy(dtype=float)
+        p = np.clip(c / n, 0.0, 1.0)
+        half = z * N * np.sqrt(fpc * p * (1 - p) / max(n - 1, 1))
+        estimate = c * N / n
+        out[f"{col}_estimate"] = np.rint(estimate).astype(np.int64)
+        # never below the rows actually observed, never above the population
+        out[f"{col}_ci_low"] = np.rint(np.maximum(estimate - half, c)).astype(np.int64)
+        out[f"{col}_ci_high"] = np.rint(np.minimum(estimate + half, N)).astype(np.int64)
+
+    for col in share_columns(frame):
+        scale = 100.0 if _name_tokens(col) & _PERCENT_TOKENS else 1.0
+        p = np.clip(frame[col].to_numpy(dtype=float) / scale, 0.0, 1.0)
+        m = np.full(len(frame), float(n))
+        if counts:
+            c = frame[counts[0]].to_numpy(dtype=float)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                m = np.where(p > 0, np.rint(c / p), m)
+        m = np.maximum(m, 1.0)
+        center = (p + z**2 / (2 * m)) / (1 + z**2 / m)
+        half = z * np.sqrt(p * (1 - p) / m + z**2 / (4 * m**2)) / (1 + z**2 / m)
+        out[f"{col}_estimate"] = frame[col]
+        out[f"{col}_ci_low"] = np.round(np.clip(center - half, 0, 1) * scale, 2)
+        out[f"{col}_ci_high"] = np.round(np.clip(center + half, 0, 1) * scale, 2)
+
+    return out
+
+
+def scale_preview_results(
+    results: Dict[str, Dict[str, Any]],
+    design: SampleDesign,
+    confidence: float = 0.95,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    scale_preview_frame applied to every payload of execute_sql_on_sqlite
+    (cached ones included), leaving out the COUNT(DISTINCT ...) aliases of
+    its query.
+    """
+    scaled = {}
+    for key, payload in results.items():
+        frame = scale_preview_frame(
+            payload["frame"], design, confidence,
+            exclude=distinct_count_aliases(payload.get("sql", "")),
+        )
+        scaled[key] = {**payload, "frame": frame, "columns": list(frame.columns)}
+    return scaled
+
+
+def refine_insights(
+    df: pd.DataFrame,
+    sql_code: str,
+    output_dir: str,
+    pipeline_kwargs: Dict[str, Any],
+    extract_kwargs: Optional[Dict[str, Any]] = None,
+    db_name: str = "refine",
+) -> Any:
+    """
+    Full-data run behind a preview: categorize every row of df with
+    run_pipeline(**pipeline_kwargs), load the analytics table in an
+    in-memory database and run the same sql_code (no new LLM call),
+    saving the results to output_dir. Returns the InsightFrames.
+    """
+    from insight_extraction.categorizer.categorize import run_pipeline
+    from insight_extraction.extraction.extract import extract_insights
+    from insight_extraction.extraction.table_creator import (
+        build_analytics_dataframe,
+        open_memory_db,
+        save_dataframe_to_sqlite,
+    )
+
+    kwargs = {**pipeline_kwargs, "sample_fraction": None, "show_plots": False}
+    allocation = run_pipeline(df=df, **kwargs)
+
+    conn = open_memory_db(db_name)
+    try:
+        save_dataframe_to_sqlite(build_analytics_dataframe(allocation), None, conn=conn)
+        frames = extract_insights(
+            db_path=None, sql_code=sql_code, output_dir=output_dir, conn=conn,
+            **(extract_kwargs or {}),
+        )
+    finally:
+        conn.close()
+    allocation.wait_for_persistence()
+    return frames
+
+
+def start_refinement(*args: Any, **kwargs: Any) -> Future:
+    """
+    refine_insights in a background thread; the Future gives its
+    InsightFrames (or raises its error).
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="refine")
+    future = executor.submit(refine_insights, *args, **kwargs)
+    executor.shutdown(wait=False)
+    return future
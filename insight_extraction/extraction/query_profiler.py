@@ -0,0 +1,88 @@
+from __future__ import annotations
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import json
+
+
+@dataclass
+class QueryProfile:
+    query_key: str
+    sql: str
+    elapsed_s: Optional[float]
+    n_rows: Optional[int]
+    vm_steps: Optional[int]
+    plan: List[str] = field(default_factory=list)
+    cached: bool = False
+    error: Optional[str] = None
+
+
+class QueryProfiler:
+    """
+    Collects one QueryProfile per labelled query run by
+    execute_sql_on_sqlite / execute_sql_parallel (profiler=...).
+
+    vm_steps is counted by the SQLite progress handler, called every
+    progress_steps VM instructions, so it is exact to within
+    progress_steps (None on the DuckDB backend). Queries answered by the
+    result cache are recorded with cached=True and no timing.
+    """
+
+    def __init__(self, progress_steps: int = 1_000) -> None:
+        self.progress_steps = progress_steps
+        self.profiles: List[QueryProfile] = []
+
+    def record(self, query_key: str, payload: Dict[str, Any]) -> None:
+        stats = payload.get("profile")
+        self.profiles.append(QueryProfile(
+            query_key=query_key,
+            sql=payload["sql"],
+            elapsed_s=stats["elapsed_s"] if stats else None,
+            n_rows=payload.get("n_rows"),
+            vm_steps=stats["vm_steps"] if stats else None,
+            plan=stats["plan"] if stats else [],
+            cached=stats is None,
+            error=payload.get("error"),
+        ))
+
+    def summary(self) -> Dict[str, Any]:
+        timed = [p for p in self.profiles if p.elapsed_s is not None]
+        slowest = max(timed, key=lambda p: p.elapsed_s, default=None)
+        return {
+            "n_queries": len(self.profiles),
+            "n_cached": sum(p.cached for p in self.profiles),
+            "n_failed": sum(p.error is not None for p in self.profiles),
+            "total_elapsed_s": sum(p.elapsed_s for p in timed),
+            "total_vm_steps": sum(p.vm_steps or 0 for p in timed),
+            "slowest_query": slowest.query_key if slowest else None,
+        }
+
+    def write_report(self, report_path: str | Path) -> Path:
+        """
+        Write the profiles and their summary as JSON; returns the path.
+        """
+        report_path = Path(report_path)
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        report = {
+            "summary": self.summary(),
+            "queries": [asdict(p) for p in self.profiles],
+        }
+        with report_path.open("w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        return report_path
+
+    def print_report(self) -> None:
+        for p in sorted(
+            self.profiles, key=lambda p: p.elapsed_s or 0.0, reverse=True
+        ):
+            if p.cached:
+                status = "cached"
+            elif p.error:
+                status = f"failed: {p.error}"
+            else:
+                status = f"{p.elapsed_s:.3f}s, {p.n_rows} rows"
+                if p.vm_steps is not None:
+                    status += f", ~{p.vm_steps} VM steps"
+            print(f"[profile] {p.query_key}: {status}")
+            for line in p.plan:
+                print(f"[profile]     {line}")
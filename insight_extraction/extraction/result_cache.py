@@ -0,0 +1,151 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, Optional
+import hashlib
+import pickle
+import re
+import sqlite3
+import threading
+import zlib
+
+from insight_extraction.extraction.table_creator import table_fingerprint
+
+# bumped when the stored payload layout or what may be stored changes
+# (old entries are ignored)
+PAYLOAD_VERSION = 5
+
+_SQL_TOKEN_RE = re.compile(
+    r"'(?:[^']|'')*'"          # string literal, kept verbatim
+    r'|"(?:[^"]|"")*"'          # quoted identifier, kept verbatim
+    r"|--[^\n]*"                # line comment
+    r"|/\*.*?\*/"               # block comment
+    r"|\s+"
+    r"|[^'\"\s/-]+|[-/]",
+    re.DOTALL,
+)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Canonical form of a query for cache lookups: comments dropped,
+    whitespace collapsed, everything outside literals lower-cased
+    (SQLite keywords and identifiers are case-insensitive), trailing
+    semicolons removed.
+    """
+    parts = []
+    for token in _SQL_TOKEN_RE.findall(sql):
+        if token.startswith(("'", '"')):
+            parts.append(token)
+        elif token.startswith("--") or token.startswith("/*") or token.isspace():
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+        else:
+            parts.append(token.lower())
+    return "".join(parts).strip().rstrip("; ").strip()
+
+
+class ResultCache:
+    """
+    On-disk cache of query results, keyed by normalized SQL and the
+    fingerprint (row count + content hash) of the queried table.
+
+    Reloading the table with different content changes the fingerprint,
+    so old entries are never served again; they are pruned with the
+    least recently used ones once max_entries is exceeded. Result frames
+    are stored pickled and zlib-compressed.
+    """
+
+    def __init__(
+        self,
+        cache_path: str | Path,
+        table_name: str = "observations_enriched",
+        max_entries: int = 1000,
+    ) -> None:
+        self.cache_path = Path(cache_path)
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self.table_name = table_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_results ("
+                "sql_hash TEXT NOT NULL, fingerprint TEXT NOT NULL, "
+                "sql TEXT, payload BLOB, last_used REAL, "
+                "PRIMARY KEY (sql_hash, fingerprint))"
+            )
+
+    def fingerprint(self, conn: sqlite3.Connection) -> Optional[str]:
+        return table_fingerprint(conn, self.table_name)
+
+    @staticmethod
+    def _key(sql: str) -> str:
+        text = f"{PAYLOAD_VERSION}:{normalize_sql(sql)}"
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _pack(payload: Dict[str, Any]) -> bytes:
+        stored = {k: payload[k] for k in ("columns", "frame", "n_rows", "truncated")}
+        return zlib.compress(pickle.dumps(stored, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _unpack(blob: bytes, sql: str) -> Dict[str, Any]:
+        stored = pickle.loads(zlib.decompress(blob))
+        stored["sql"] = sql
+        return stored
+
+    def get(self, sql: str, fingerprint: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Cached payload for sql on a table with this fingerprint, or None.
+        """
+        if fingerprint is None:
+            return None
+        key = self._key(sql)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM query_results WHERE sql_hash = ? AND fingerprint = ?",
+                (key, fingerprint),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE query_results SET last_used = julianday('now') "
+                    "WHERE sql_hash = ? AND fingerprint = ?",
+                    (key, fingerprint),
+                )
+            self.hits += 1
+        return self._unpack(row[0], sql)
+
+    def put(self, sql: str, fingerprint: Optional[str], payload: Dict[str, Any]) -> None:
+        """
+        Store the payload of sql. Results cut at a row cap are not
+        stored: the key does not include the QueryLimits, so they would
+        be served as complete to runs with a higher cap or none.
+        """
+        if fingerprint is None or payload.get("truncated"):
+            return
+        blob = self._pack(payload)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_results "
+                "(sql_hash, fingerprint, sql, payload, last_used) "
+                "VALUES (?, ?, ?, ?, julianday('now'))",
+                (self._key(sql), fingerprint, sql, blob),
+            )
+            self._conn.execute(
+                "DELETE FROM query_results WHERE rowid NOT IN ("
+                "SELECT rowid FROM query_results ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM query_results")
+
+    def close(self) -> None:
+        self._conn.close()
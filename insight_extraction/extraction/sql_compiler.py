@@ -0,0 +1,242 @@
+from __future__ import annotations
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+SUPPORTED_METRICS = (
+    "count_events",
+    "proportion_events",
+    "avg_processing_time",
+    "trend_over_time",
+)
+
+# dimension_type handled through event_year / event_month, not as a category
+TIME_DIMENSION = "TIME"
+
+_EQUALITY_OPS = {"=": "=", "==": "=", "!=": "<>", "<>": "<>"}
+_LIST_OPS = {"IN": "IN", "NOT IN": "NOT IN"}
+
+
+def _quote(value: Any) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    if value in (None, ""):
+        return None
+    return date.fromisoformat(str(value)[:10])
+
+
+def _time_conditions(time_spec: Dict[str, Any]) -> Tuple[List[str], bool]:
+    """
+    WHERE conditions for intent["time"] and whether they need the
+    observation_date column (from / to) rather than event_year / event_month.
+    Raises ValueError on values that cannot be compiled.
+    """
+    conditions: List[str] = []
+    date_start = _parse_date(time_spec.get("from"))
+    date_end = _parse_date(time_spec.get("to"))
+    year = time_spec.get("year")
+    month = time_spec.get("month")
+
+    if year not in (None, ""):
+        conditions.append(f"event_year = {int(year)}")
+    if month not in (None, ""):
+        conditions.append(f"event_month = {int(month)}")
+
+    # with year / month set, a from / to covering the same period is redundant
+    if year not in (None, "") and month in (None, "") and date_start and date_end:
+        if (date_start, date_end) == (date(int(year), 1, 1), date(int(year), 12, 31)):
+            date_start = date_end = None
+
+    if date_start is not None:
+        conditions.append(f"observation_date >= '{date_start.isoformat()}'")
+    if date_end is not None:
+        # "to" is inclusive; stored dates carry a time part
+        conditions.append(
+            f"observation_date < '{(date_end + timedelta(days=1)).isoformat()}'"
+        )
+    return conditions, date_start is not None or date_end is not None
+
+
+def _category_label(value: Any, labels: Optional[Sequence[Any]]) -> Any:
+    """
+    The active category matching value (case-insensitively); labels None
+    means unknown categories, value is kept as is.
+    Raises ValueError when value is not an active category.
+    """
+    if labels is None:
+        return value
+    by_name = {str(label).strip().casefold(): label for label in labels}
+    label = by_name.get(str(value).strip().casefold())
+    if label is None:
+        raise ValueError(f"Not an active category: {value!r}")
+    return label
+
+
+def _filter_conditions(
+    filters: Sequence[Dict[str, Any]],
+    schema_columns: Sequence[str],
+    categories: Optional[Dict[str, Sequence[Any]]] = None,
+) -> Tuple[List[str], List[str]]:
+    """
+    WHERE conditions for intent["filters"] (=, !=, IN, NOT IN on the
+    dimension columns) and the columns they use.
+    With categories (column -> active categories), every value must be
+    one of them: a label the categorization did not produce (made up, or
+    dropped by min_support_ratio) would silently match nothing.
+    Raises ValueError on filters that cannot be compiled.
+    """
+    conditions: List[str] = []
+    columns: List[str] = []
+    for flt in filters or []:
+        col = str(flt.get("dimension_type", "")).lower()
+        op = str(flt.get("operator", "=")).strip().upper()
+        value = flt.get("value")
+        if col not in schema_columns or value in (None, ""):
+            raise ValueError(f"Cannot compile filter: {flt}")
+        labels = categories.get(col) if categories is not None else None
+        if categories is not None and labels is None:
+            raise ValueError(f"Not a categorized dimension: {col}")
+
+        if op in _EQUALITY_OPS:
+            value = _category_label(value, labels)
+            conditions.append(f"{col} {_EQUALITY_OPS[op]} {_quote(value)}")
+        elif op in _LIST_OPS:
+            values = value if isinstance(value, list) else str(value).split(",")
+            values = [
+                _category_label(str(v).strip(), labels) for v in values if str(v).strip()
+            ]
+            if not values:
+                raise ValueError(f"Cannot compile filter: {flt}")
+            conditions.append(
+                f"{col} {_LIST_OPS[op]} ({', '.join(_quote(v) for v in values)})"
+            )
+        else:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        columns.append(col)
+    return conditions, columns
+
+
+def _where(conditions: Sequence[str], sep: str = "\n") -> str:
+    return f"{sep}WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def compile_intent_to_sql(
+    intent: Dict[str, Any],
+    schema_columns: Sequence[str],
+    main_table: str = "observations_enriched",
+    rollup_table: Optional[str] = None,
+    rollup_schema: Optional[Sequence[str]] = None,
+    categories: Optional[Dict[str, Sequence[Any]]] = None,
+) -> Optional[str]:
+    """
+    Compile common intent shapes into labelled SQL blocks, in the format
+    parsed by parse_llm_sql_response, without calling the LLM.
+
+    Supported: metrics in SUPPORTED_METRICS, grouped by each
+    group_by dimension present in the schema (TIME is read as
+    event_year / event_month), restricted by intent["time"]
+    (year / month / from / to) and by =, !=, IN, NOT IN filters.
+    One block per (metric, dimension); the first is the MAIN QUERY.
+    Proportions use a scalar subquery as denominator (all events in
+    the same time window and filters), no window functions.
+
+    The rollup table is used when every column involved is in it (no
+    from / to date window). categories (dimension column -> active
+    categories, see table_creator.dimension_categories) restricts the
+    filter values to labels present in the table. Returns None for
+    anything else (unknown metric, dimension, filter or category), so the
+    caller can fall back to the LLM.
+    """
+    metrics = [str(m) for m in (intent.get("metrics") or [])]
+    if not metrics or any(m not in SUPPORTED_METRICS for m in metrics):
+        return None
+
+    schema_columns = list(schema_columns)
+    dims: List[str] = []
+    for group in intent.get("group_by") or []:
+        dim_type = str(group.get("dimension_type") or "")
+        if not dim_type or dim_type.upper() == TIME_DIMENSION:
+            continue
+        if dim_type.lower() not in schema_columns:
+            return None
+        if dim_type.lower() not in dims:
+            dims.append(dim_type.lower())
+
+    try:
+        time_conds, needs_dates = _time_conditions(intent.get("time") or {})
+        filter_conds, filter_cols = _filter_conditions(
+            intent.get("filters") or [], schema_columns, categories
+        )
+    except (TypeError, ValueError):
+        return None
+
+    if "proportion_events" in metrics and not dims:
+        return None
+
+    use_rollup = (
+        rollup_table is not None
+        and rollup_schema is not None
+        and not needs_dates
+        and all(c in rollup_schema for c in dims + filter_cols + ["event_year", "event_month"])
+    )
+    table = rollup_table if use_rollup else main_table
+    if use_rollup:
+        n_events = "SUM(n_observations)"
+        avg_time = (
+            "ROUND(SUM(sum_processing_time_days) * 1.0 "
+            "/ SUM(count_processing_time_days), 2)"
+        )
+        n_processed = "SUM(count_processing_time_days)"
+    else:
+        n_events = "COUNT(*)"
+        avg_time = "ROUND(AVG(processing_time_days), 2)"
+        n_processed = "COUNT(processing_time_days)"
+
+    base_conds = time_conds + filter_conds
+    blocks: List[str] = []
+
+    for metric in metrics:
+        for dim in dims or [None]:
+            group_cols = [dim] if dim else []
+            conds = base_conds + [f"{c} IS NOT NULL" for c in group_cols]
+            select_keys = "".join(f"{c}, " for c in group_cols)
+            group_by = f"\nGROUP BY {', '.join(group_cols)}" if group_cols else ""
+
+            if metric == "count_events":
+                order = f"\nORDER BY n_events DESC, {dim}" if group_cols else ""
+                sql = (
+                    f"SELECT {select_keys}{n_events} AS n_events\n"
+                    f"FROM {table}{_where(conds)}{group_by}{order}"
+                )
+            elif metric == "proportion_events":
+                sql = (
+                    f"SELECT {select_keys}{n_events} AS n_events,\n"
+                    f"       ROUND(100.0 * {n_events} / "
+                    f"(SELECT {n_events} FROM {table}{_where(base_conds, ' ')}), 2)"
+                    f" AS pct_of_all_events\n"
+                    f"FROM {table}{_where(conds)}{group_by}\n"
+                    f"ORDER BY n_events DESC, {dim}"
+                )
+            elif metric == "avg_processing_time":
+                order = f"\nORDER BY avg_processing_time_days DESC, {dim}" if group_cols else ""
+                if not use_rollup:
+                    conds = conds + ["processing_time_days IS NOT NULL"]
+                sql = (
+                    f"SELECT {select_keys}{avg_time} AS avg_processing_time_days,\n"
+                    f"       {n_processed} AS n_processed\n"
+                    f"FROM {table}{_where(conds)}{group_by}{order}"
+                )
+            else:  # trend_over_time
+                keys = ["event_year", "event_month"] + group_cols
+                sql = (
+                    f"SELECT {', '.join(keys)}, {n_events} AS n_events\n"
+                    f"FROM {table}{_where(conds + ['event_year IS NOT NULL'])}\n"
+                    f"GROUP BY {', '.join(keys)}\n"
+                    f"ORDER BY {', '.join(keys)}"
+                )
+
+            label = "MAIN QUERY" if not blocks else f"EXTRA_INSIGHT_QUERY_{len(blocks)}"
+            blocks.append(f"-- {label}\n{sql};")
+
+    return "\n\n".join(blocks)
@@ -1,6 +1,13 @@
 from __future__ import annotations
-from typing import Dict, List, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+import queue
 import sqlite3
+import time
+
+import pandas as pd
 
 
 def parse_llm_sql_response(response: str) -> Dict[str, str]:
@@ -62,14 +69,200 @@ def parse_llm_sql_response(response: str) -> Dict[str, str]:
     return sql_queries
 
 
+@dataclass
+class QueryLimits:
+    """
+    Guardrails applied to every labelled query.
+
+    timeout_s : wall-clock budget per query (execution + fetch), enforced
+        with SQLite's progress handler; None disables it.
+    max_rows : rows kept per result; the rest is not fetched and the
+        payload is flagged as truncated. None disables it.
+    fetch_size : rows pulled per fetchmany call.
+    progress_steps : VM instructions between two progress-handler checks.
+    """
+    timeout_s: Optional[float] = 60.0
+    max_rows: Optional[int] = 100_000
+    fetch_size: int = 5_000
+    progress_steps: int = 10_000
+
+
+DEFAULT_LIMITS = QueryLimits()
+
+
+def _build_result_frame(
+    col_names: List[str],
+    buffers: List[List[Any]],
+) -> pd.DataFrame:
+    """
+    Typed DataFrame from the column buffers of a result, numeric
+    columns rounded to two decimal places (duplicate column names are
+    kept).
+    """
+    frame = pd.DataFrame(dict(enumerate(buffers)))
+    frame = frame.round(2)
+    frame.columns = col_names
+    return frame
+
+
+def _execute_labelled_query(
+    conn: sqlite3.Connection,
+    sql: str,
+    limits: Optional[QueryLimits] = None,
+    profile_steps: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Run one labelled query on its own cursor and return its payload:
+    {"sql", "columns", "frame" (typed DataFrame, numeric columns
+    rounded), "n_rows", "truncated"}.
+
+    Rows are streamed with fetchmany straight into the column buffers,
+    up to limits.max_rows. A query that fails or exceeds
+    limits.timeout_s returns {"sql", "error"} instead.
+
+    With profile_steps, the payload also gets a "profile" entry
+    (elapsed_s, vm_steps counted by the progress handler every
+    profile_steps instructions, EXPLAIN QUERY PLAN lines).
+    """
+    limits = limits or DEFAULT_LIMITS
+    profiling = profile_steps is not None
+
+    deadline = (
+        time.monotonic() + limits.timeout_s if limits.timeout_s is not None else None
+    )
+    handler_steps = limits.progress_steps
+    if profiling:
+        handler_steps = min(handler_steps, profile_steps)
+    n_calls = 0
+
+    def on_progress() -> bool:
+        nonlocal n_calls
+        n_calls += 1
+        # a non-zero return value interrupts the running statement
+        return deadline is not None and time.monotonic() > deadline
+
+    if deadline is not None or profiling:
+        conn.set_progress_handler(on_progress, handler_steps)
+
+    payload: Dict[str, Any]
+    start = time.perf_counter()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql)
+        col_names: List[str] = (
+            [desc[0] for desc in cursor.description] if cursor.description else []
+        )
+        buffers: List[List[Any]] = [[] for _ in col_names]
+        n_rows = 0
+        truncated = False
+
+        while True:
+            size = limits.fetch_size
+            if limits.max_rows is not None:
+                size = min(size, limits.max_rows - n_rows)
+            batch = cursor.fetchmany(size) if size > 0 else []
+            if not batch:
+                truncated = (
+                    limits.max_rows is not None
+                    and n_rows >= limits.max_rows
+                    and cursor.fetchone() is not None
+                )
+                break
+            for buffer, column in zip(buffers, zip(*batch)):
+                buffer.extend(column)
+            n_rows += len(batch)
+        payload = {
+            "sql": sql,
+            "columns": col_names,
+            "frame": _build_result_frame(col_names, buffers),
+            "n_rows": n_rows,
+            "truncated": truncated,
+        }
+    except sqlite3.Error as exc:
+        if deadline is not None and time.monotonic() > deadline:
+            payload = {"sql": sql, "error": f"timed out after {limits.timeout_s}s"}
+        else:
+            payload = {"sql": sql, "error": str(exc)}
+    finally:
+        cursor.close()
+        if deadline is not None or profiling:
+            conn.set_progress_handler(None, 0)
+
+    if profiling:
+        elapsed = time.perf_counter() - start
+        try:
+            plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        except sqlite3.Error:
+            plan = []
+        payload["profile"] = {
+            "elapsed_s": elapsed,
+            "vm_steps": n_calls * handler_steps,
+            "plan": plan,
+        }
+
+    return payload
+
+
+def _collect_result(
+    results: Dict[str, Dict[str, Any]],
+    key: str,
+    payload: Dict[str, Any],
+    profiler: Optional[Any] = None,
+) -> None:
+    """
+    Log one query result and keep it unless it failed or is empty.
+    """
+    sql = payload["sql"]
+    if profiler is not None:
+        profiler.record(key, payload)
+
+    print(f"------- {key.replace(' ', '_').replace('/', '_').split(':')[0]} -------\n")
+    if "error" in payload:
+        print(f"⚠️ Query \n\t{sql}\n failed ({payload['error']}). Skipping it.\n")
+        print(f"-----------------------------------------\n")
+        return
+
+    n_rows = payload["n_rows"]
+    # Skip empty result sets (no rows returned)
+    if not n_rows:
+        print(f">>> Executes \n\t{sql}\n script, 0 rows retrieved. Skipping empty dataset.\n")
+    else:
+        results[key] = payload
+        print(f">>> Executes \n\t{sql}\n script, {n_rows} rows retrieved.\n")
+        if payload.get("truncated"):
+            print(f"⚠️ Result capped at {n_rows} rows.\n")
+    print(f"-----------------------------------------\n")
+
+
+def _cached_payload(
+    cache: Optional[Any],
+    fingerprint: Optional[str],
+    sql: str,
+) -> Optional[Dict[str, Any]]:
+    return cache.get(sql, fingerprint) if cache is not None else None
+
+
 def execute_sql_on_sqlite(
-    db_path: str,
+    db_path: Optional[str],
     sql_response: str,
+    conn: Optional[sqlite3.Connection] = None,
+    cache: Optional[Any] = None,
+    limits: Optional[QueryLimits] = None,
+    profiler: Optional[Any] = None,
 ) -> Dict[str, Dict[str, Any]]:
     """
     Given:
       - db_path: path to your SQLite database file
       - sql_response: the raw string returned by the LLM (with labelled queries)
+      - conn: optional open connection (e.g. the in-memory database filled
+        by define_queries), used instead of db_path and left open
+      - cache: optional result_cache.ResultCache; queries already run on
+        the same table content are answered from it
+      - limits: QueryLimits (timeout, row cap, fetch size); DEFAULT_LIMITS
+        when None. A query that fails or times out is skipped with a
+        warning instead of stopping the run.
+      - profiler: optional query_profiler.QueryProfiler recording time,
+        rows, VM steps and query plan of every query
 
     1. Parse the response into separate queries.
     2. Execute each query against the SQLite DB.
@@ -78,7 +271,9 @@ def execute_sql_on_sqlite(
            "main_query": {
                "sql": "<the SQL text>",
                "columns": ["col1", "col2", ...],
-               "rows": [(...), (...), ...]
+               "frame": <pd.DataFrame, numeric columns rounded to 2 decimals>,
+               "n_rows": <int>,
+               "truncated": <bool>   # row cap reached
            },
            "extra_insight_query_1": { ... },
            ...
@@ -86,81 +281,134 @@ def execute_sql_on_sqlite(
 
     NOTE: This assumes each block contains a single SELECT statement.
     """
-
-    def _round_numeric_values(row: Tuple[Any, ...]) -> Tuple[Any, ...]:
-        """
-        Round all numeric values in a row to two decimal places.
-        Non-numeric values are returned unchanged.
-        """
-        rounded_row = []
-        for value in row:
-            if isinstance(value, (int, float)):
-                # Round numeric values to 2 decimal places
-                rounded_row.append(round(value, 2))
-            else:
-                rounded_row.append(value)
-        return tuple(rounded_row)
-
     queries = parse_llm_sql_response(sql_response)
 
     results: Dict[str, Dict[str, Any]] = {}
 
-    conn = sqlite3.connect(db_path)
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(db_path)
+    profile_steps = profiler.progress_steps if profiler is not None else None
+    # the queries never write, even on the caller's writable connection
+    was_query_only = conn.execute("PRAGMA query_only").fetchone()[0]
+    conn.execute("PRAGMA query_only = ON")
     try:
-        cursor = conn.cursor()
-
+        fingerprint = cache.fingerprint(conn) if cache is not None else None
         for key, sql in queries.items():
-            # Execute the query
-            cursor.execute(sql)
-            rows = cursor.fetchall()
-
-            col_names: List[str] = (
-                [desc[0] for desc in cursor.description] if cursor.description else []
-            )
-
-            round_rows = [_round_numeric_values(row) for row in rows]
-
-            # Skip empty result sets (no rows returned)
-            if not rows:
-                print(f"------- {key.replace(' ', '_').replace('/', '_').split(':')[0]} -------\n")
-                print(f">>> Executes \n\t{sql}\n script, 0 rows retrieved. Skipping empty dataset.\n")
-                print(f"-----------------------------------------\n")
-                continue
-
-            results[key] = {
-                "sql": sql,
-                "columns": col_names,
-                "rows": round_rows,
-            }
-            print(f"------- {key.replace(' ', '_').replace('/', '_').split(':')[0]} -------\n")
-            print(f">>> Executes \n\t{sql}\n script, {len(round_rows)} rows retrieved.\n")
-            print(f"-----------------------------------------\n")
-
+            payload = _cached_payload(cache, fingerprint, sql)
+            if payload is None:
+                payload = _execute_labelled_query(conn, sql, limits, profile_steps)
+                if cache is not None and "error" not in payload:
+                    cache.put(sql, fingerprint, payload)
+            _collect_result(results, key, payload, profiler)
     finally:
-        conn.close()
+        if not was_query_only:
+            conn.execute("PRAGMA query_only = OFF")
+        if own_conn:
+            conn.close()
 
     return results
 
 
-# Optional helper: convert results to pandas DataFrames (if you use pandas)
-def results_to_dataframes(
-    results: Dict[str, Dict[str, Any]]
-) -> Dict[str, "pd.DataFrame"]:  # type: ignore[name-defined]
+def _reader_uri(
+    db_path: Optional[str],
+    conn: Optional[sqlite3.Connection],
+) -> Optional[str]:
     """
-    Convert the output of execute_sql_on_sqlite into pandas DataFrames.
-    Requires pandas installed.
+    URI for extra connections to the same database: the in-memory one
+    behind conn (open_memory_db) or the db_path file in read-only mode.
+    None when the database cannot be shared (private connection).
     """
-    import pandas as pd
+    if conn is not None:
+        return getattr(conn, "uri", None) or None
+    return f"file:{Path(db_path).resolve()}?mode=ro"
 
-    dfs: Dict[str, pd.DataFrame] = {}
 
-    for key, payload in results.items():
-        cols = payload["columns"]
-        rows = payload["rows"]
-        df = pd.DataFrame(rows, columns=cols)
-        dfs[key] = df
+def execute_sql_parallel(
+    db_path: Optional[str],
+    sql_response: str,
+    conn: Optional[sqlite3.Connection] = None,
+    max_workers: int = 4,
+    cache: Optional[Any] = None,
+    limits: Optional[QueryLimits] = None,
+    profiler: Optional[Any] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Same as execute_sql_on_sqlite, but the labelled queries run
+    concurrently in threads, each worker on its own read-only
+    (query_only) connection from a pool of at most max_workers.
+
+    Results and logs keep the order of the labelled blocks. Falls back
+    to execute_sql_on_sqlite with a single query, max_workers <= 1 or a
+    connection that cannot be shared. Cached results (cache) are reused
+    and only the misses are executed.
+    """
+    queries = parse_llm_sql_response(sql_response)
+    uri = _reader_uri(db_path, conn)
+    if max_workers <= 1 or len(queries) <= 1 or uri is None:
+        return execute_sql_on_sqlite(
+            db_path, sql_response, conn=conn, cache=cache, limits=limits,
+            profiler=profiler,
+        )
+
+    fingerprint = None
+    cached: Dict[str, Dict[str, Any]] = {}
+    if cache is not None:
+        fp_conn = conn if conn is not None else sqlite3.connect(db_path)
+        try:
+            fingerprint = cache.fingerprint(fp_conn)
+        finally:
+            if fp_conn is not conn:
+                fp_conn.close()
+        for key, sql in queries.items():
+            payload = _cached_payload(cache, fingerprint, sql)
+            if payload is not None:
+                cached[key] = payload
+
+    n_workers = min(max_workers, len(queries) - len(cached))
+    profile_steps = profiler.progress_steps if profiler is not None else None
+
+    pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+    readers = []
+    for _ in range(n_workers):
+        reader = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        reader.execute("PRAGMA query_only = ON")
+        readers.append(reader)
+        pool.put(reader)
+
+    def run(sql: str) -> Dict[str, Any]:
+        reader = pool.get()
+        try:
+            return _execute_labelled_query(reader, sql, limits, profile_steps)
+        finally:
+            pool.put(reader)
 
-    return dfs
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        with ThreadPoolExecutor(max_workers=max(n_workers, 1), thread_name_prefix="sql") as executor:
+            futures = {
+                key: executor.submit(run, sql)
+                for key, sql in queries.items() if key not in cached
+            }
+            for key, sql in queries.items():
+                if key in cached:
+                    payload = cached[key]
+                else:
+                    payload = futures[key].result()
+                    if cache is not None and "error" not in payload:
+                        cache.put(sql, fingerprint, payload)
+                _collect_result(results, key, payload, profiler)
+    finally:
+        for reader in readers:
+            reader.close()
+
+    return results
 
 
-    
+def results_to_dataframes(
+    results: Dict[str, Dict[str, Any]]
+) -> Dict[str, pd.DataFrame]:
+    """
+    DataFrames of the output of execute_sql_on_sqlite, by query key.
+    """
+    return {key: payload["frame"] for key, payload in results.items()}
@@ -1,6 +1,11 @@
 import json
-from typing import Any, Dict, Optional
-from insight_extraction.prompts.extraction_prompt import build_extraction_prompt
+import re
+from typing import Any, Dict, List, Optional
+from insight_extraction.prompts.extraction_prompt import (
+    build_extraction_prompt,
+    build_repair_prompt,
+)
+from insight_extraction.extraction.sql_compiler import compile_intent_to_sql
 
 
 class SQLQueryGenerator:
@@ -25,11 +30,33 @@ class SQLQueryGenerator:
 
         main_table: str,
         schema_text: Optional[Any] = None,
+        rollup_table: Optional[str] = None,
+        rollup_schema: Optional[List[str]] = None,
+        compile_first: bool = True,
+        categories: Optional[Dict[str, List[Any]]] = None,
     ) -> str:
         """
         Costruisce il prompt completo, chiama il modello e restituisce
         il codice SQL (potenzialmente più query).
+
+        Con compile_first=True gli intent comuni vengono prima compilati
+        in SQL in modo deterministico (compile_intent_to_sql); il modello
+        viene chiamato solo se l'intent non è compilabile (anche quando un
+        filtro usa un valore che non è tra le categorie attive, categories).
         """
+        if compile_first and schema_text is not None:
+            compiled = compile_intent_to_sql(
+                json_spec,
+                schema_columns=schema_text,
+                main_table=main_table,
+                rollup_table=rollup_table,
+                rollup_schema=rollup_schema,
+                categories=categories,
+            )
+            if compiled is not None:
+                print(">>> SQL compiled from intent, LLM not called.")
+                return compiled
+
         prompt = build_extraction_prompt(
             user_question=user_question,
             json_spec=json_spec,
@@ -37,7 +64,37 @@ class SQLQueryGenerator:
             main_table=main_table,
             sql_dialect=self.sql_dialect,
             schema_text=schema_text,
+            rollup_table=rollup_table,
+            rollup_schema=rollup_schema,
         )
 
         sql_code = self.llm_client.invoke(prompt)
-        return sql_code
\ No newline at end of file
+        return sql_code
+
+    def repair_sql(
+        self,
+        sql: str,
+        error_message: str,
+        schema_text: str,
+        main_table: str,
+    ) -> str:
+        """
+        Chiede al modello di correggere UNA query non valida, dato
+        l'errore del database e lo schema reale; restituisce solo SQL
+        (eventuali backtick / etichette vengono rimossi).
+        """
+        prompt = build_repair_prompt(
+            sql=sql,
+            error_message=error_message,
+            schema_text=schema_text,
+            main_table=main_table,
+            sql_dialect=self.sql_dialect,
+        )
+
+        response = self.llm_client.invoke(prompt)
+        response = re.sub(r"^```\w*\s*|```\s*$", "", response.strip())
+        lines = [
+            line for line in response.splitlines()
+            if not line.strip().startswith("--")
+        ]
+        return "\n".join(lines).strip()
@@ -0,0 +1,162 @@
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+import re
+import sqlite3
+
+_LEADING_COMMENTS_RE = re.compile(r"^(\s*(--[^\n]*\n|/\*.*?\*/))*\s*", re.DOTALL)
+
+# authorizer actions of a read-only query; anything else (INSERT, UPDATE,
+# DELETE, CREATE, PRAGMA, ATTACH ...) fails the preparation
+_READ_ONLY_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    sqlite3.SQLITE_RECURSIVE,
+}
+
+
+def validate_sql(conn: sqlite3.Connection, sql: str) -> Optional[str]:
+    """
+    Pre-flight check of one labelled query: it must be a read-only
+    SELECT (or WITH ... SELECT) that SQLite can prepare against the real
+    schema (EXPLAIN compiles it without running it). The preparation
+    goes through an authorizer that denies every write, so e.g.
+    WITH ... DELETE is rejected too.
+
+    Returns None when valid, otherwise the error message.
+    """
+    body = _LEADING_COMMENTS_RE.sub("", sql, count=1)
+    first_word = body.split(None, 1)[0].upper() if body.strip() else ""
+    if first_word not in ("SELECT", "WITH"):
+        return "only SELECT / WITH ... SELECT statements are allowed"
+
+    denied = []
+
+    def read_only(action: int, *args: Any) -> int:
+        if action in _READ_ONLY_ACTIONS:
+            return sqlite3.SQLITE_OK
+        denied.append(action)
+        return sqlite3.SQLITE_DENY
+
+    conn.set_authorizer(read_only)
+    try:
+        conn.execute(f"EXPLAIN {sql}").fetchall()
+    except (sqlite3.Error, sqlite3.Warning) as exc:
+        if denied:
+            return "only read-only SELECT / WITH ... SELECT statements are allowed"
+        # includes "You can only execute one statement at a time."
+        return str(exc)
+    finally:
+        conn.set_authorizer(None)
+    return None
+
+
+def validate_queries(
+    conn: sqlite3.Connection,
+    queries: Dict[str, str],
+    validator: Callable[[Any, str], Optional[str]] = validate_sql,
+) -> Tuple[Dict[str, str], Dict[str, Tuple[str, str]]]:
+    """
+    Split labelled queries into valid ones {key: sql} and invalid ones
+    {key: (sql, error)}. validator checks one query on conn
+    (validate_sql, or duckdb_execute.validate_sql_duckdb).
+    """
+    valid: Dict[str, str] = {}
+    invalid: Dict[str, Tuple[str, str]] = {}
+    for key, sql in queries.items():
+        error = validator(conn, sql)
+        if error is None:
+            valid[key] = sql
+        else:
+            invalid[key] = (sql, error)
+    return valid, invalid
+
+
+def format_labelled_sql(queries: Dict[str, str]) -> str:
+    """
+    Inverse of parse_llm_sql_response: labelled blocks as one string.
+    """
+    return "\n\n".join(f"-- {key}\n{sql}" for key, sql in queries.items())
+
+
+def schema_summary(conn: sqlite3.Connection) -> str:
+    """
+    "table(col1, col2, ...)" lines for the user tables and views.
+    """
+    lines = []
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') "
+        "AND name NOT LIKE 'sqlite_%' AND name NOT LIKE '\\_%' ESCAPE '\\' "
+        "ORDER BY name"
+    ).fetchall()
+    for (name,) in rows:
+        cols = [r[1] for r in conn.execute(f'PRAGMA table_info("{name}")').fetchall()]
+        lines.append(f"- {name}({', '.join(cols)})")
+    return "\n".join(lines)
+
+
+def start_repairs(
+    generator: Any,
+    invalid: Dict[str, Tuple[str, str]],
+    schema_text: str,
+    main_table: str,
+) -> Tuple[ThreadPoolExecutor, Dict[str, Future]]:
+    """
+    Send every invalid block to generator.repair_sql in background
+    threads (the LLM calls overlap with the execution of the valid
+    blocks). Returns the executor (to shut down) and one future per key.
+    """
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(4, len(invalid))), thread_name_prefix="sql-repair"
+    )
+    futures = {
+        key: executor.submit(generator.repair_sql, sql, error, schema_text, main_table)
+        for key, (sql, error) in invalid.items()
+    }
+    return executor, futures
+
+
+def repair_queries(
+    conn: sqlite3.Connection,
+    generator: Any,
+    invalid: Dict[str, Tuple[str, str]],
+    main_table: str,
+    max_attempts: int = 1,
+    pending: Optional[Dict[str, Future]] = None,
+    validator: Callable[[Any, str], Optional[str]] = validate_sql,
+) -> Tuple[Dict[str, str], Dict[str, Tuple[str, str]]]:
+    """
+    Repair loop: each invalid block gets up to max_attempts calls to
+    generator.repair_sql (the first may already be running in `pending`,
+    see start_repairs), each answer being validated again.
+
+    Returns the repaired {key: sql} and the blocks still invalid.
+    """
+    schema_text = schema_summary(conn)
+    repaired: Dict[str, str] = {}
+    still_invalid: Dict[str, Tuple[str, str]] = {}
+
+    for key, (sql, error) in invalid.items():
+        for attempt in range(max_attempts):
+            try:
+                if attempt == 0 and pending is not None and key in pending:
+                    fixed = pending[key].result()
+                else:
+                    fixed = generator.repair_sql(sql, error, schema_text, main_table)
+            except Exception as exc:
+                error = f"repair failed: {exc}"
+                break
+
+            new_error = validator(conn, fixed)
+            print(f"[sql repair] {key} (attempt {attempt + 1}): "
+                  f"{'ok' if new_error is None else new_error}")
+            sql, error = fixed, new_error
+            if new_error is None:
+                repaired[key] = fixed
+                break
+
+        if key not in repaired:
+            still_invalid[key] = (sql, error)
+
+    return repaired, still_invalid
@@ -1,16 +1,33 @@
 # analytics_table.py
 
 from __future__ import annotations
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import hashlib
 import json
 import pandas as pd
 import numpy as np
 import sqlite3
 from pathlib import Path
 
+from insight_extraction.categorizer.allocation import CategoryAllocation
+from insight_extraction.categorizer.my_io.save_json import (
+    COLUMNAR_SUFFIXES,
+    load_assignment_columnar,
+)
 
-def load_assignments(assignments_path: str | Path) -> List[Dict[str, Any]]:
+
+def load_assignments(
+    assignments_path: str | Path,
+) -> List[Dict[str, Any]] | CategoryAllocation:
+    """
+    Load an allocation file: JSON records, or a CategoryAllocation for
+    the columnar formats (.parquet / .arrow / .feather). Both are
+    accepted by build_analytics_dataframe.
+    """
     assignments_path = Path(assignments_path)
+    if assignments_path.suffix in COLUMNAR_SUFFIXES:
+        return load_assignment_columnar(str(assignments_path))
+
     with assignments_path.open("r", encoding="utf-8") as f:
         data = json.load(f)
 
@@ -21,73 +38,552 @@ def load_assignments(assignments_path: str | Path) -> List[Dict[str, Any]]:
 
 
 def build_analytics_dataframe(
-    assignments: List[Dict[str, Any]],
+    assignments: List[Dict[str, Any]] | CategoryAllocation,
     include_raw_index: bool = True,
 ) -> pd.DataFrame:
+    """
+    Build the analytics table column by column.
+
+    JSON records are first turned into a CategoryAllocation (one pass per
+    field); a CategoryAllocation kept in memory is used as is. Dimension
+    columns are categorical, dates datetime64, and processing_time_days,
+    event_year and event_month are computed on whole arrays.
+    """
+    if not isinstance(assignments, CategoryAllocation):
+        assignments = CategoryAllocation.from_records(assignments)
+    allocation = assignments
+
+    obs_date = pd.DatetimeIndex(allocation.observation_date)
+    proc_date = pd.DatetimeIndex(allocation.processed_date)
+
+    columns: Dict[str, Any] = {}
+    if include_raw_index:
+        columns["row_id"] = np.asarray(allocation.row_index, dtype=np.int64)
+    if allocation.observation_id is not None:
+        # records produced by the incremental pipeline carry a stable id
+        columns["observation_id"] = allocation.observation_id
+
+    columns["observation_date"] = obs_date
+    columns["processed_date"] = proc_date
+
+    for dim_type, categories in allocation.assignments.items():
+        columns[dim_type.lower()] = pd.Categorical(categories)
+
+    columns["processing_time_days"] = (
+        (proc_date - obs_date) / np.timedelta64(1, "D")
+    ).to_numpy(dtype=float, na_value=np.nan)
+    columns["event_year"] = pd.array(obs_date.year, dtype="Int64")
+    columns["event_month"] = pd.array(obs_date.month, dtype="Int64")
+
+    return pd.DataFrame(columns)
+
 
-    dimension_types = set()
-    for rec in assignments:
-        assignments_dict = rec.get("assignments", {}) or {}
-        for dim_type in assignments_dict.keys():
-            dimension_types.add(dim_type)
+# connection settings for the one-shot bulk load (the database is a
+# derived artifact, rebuilt from the allocation at every run)
+BULK_LOAD_PRAGMAS = {
+    "journal_mode": "MEMORY",
+    "synchronous": "OFF",
+    "cache_size": -65536,  # KiB -> 64 MiB page cache
+    "temp_store": "MEMORY",
+}
+
+DATE_COLUMNS = ("observation_date", "processed_date")
+TIME_COLUMNS = ("event_year", "event_month")
+ROLLUP_TABLE = "observations_rollup"
+ROLLUP_MEASURES = (
+    "n_observations",
+    "sum_processing_time_days",
+    "count_processing_time_days",
+)
+
+
+def _sqlite_type(series: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(series):
+        return "REAL"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "TIMESTAMP"
+    return "TEXT"
+
+
+def _sqlite_column_values(series: pd.Series) -> List[Any]:
+    """
+    One column as a list of values accepted by sqlite3: datetimes as text
+    like DataFrame.to_sql does (only distinct values are formatted),
+    NaN/NaT/NA as None.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        codes, uniques = pd.factorize(series)
+        # code -1 (NaT) picks the trailing None
+        lookup = np.append(
+            np.asarray(uniques.strftime("%Y-%m-%d %H:%M:%S"), dtype=object), None
+        )
+        return lookup[codes].tolist()
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        lookup = np.append(np.asarray(series.cat.categories, dtype=object), None)
+        return lookup[series.cat.codes.to_numpy()].tolist()
+    values = series.astype(object)
+    return values.where(series.notna(), None).tolist()
+
+
+def _to_sqlite_values(df: pd.DataFrame) -> List[tuple]:
+    """
+    Convert a DataFrame into plain Python tuples accepted by sqlite3
+    (datetimes stored as text like DataFrame.to_sql does, NaN/NaT as NULL).
+    """
+    columns = [_sqlite_column_values(df[col]) for col in df.columns]
+    return list(zip(*columns))
+
+
+def _dimension_columns(df: pd.DataFrame) -> List[str]:
+    """
+    Dimension columns of an analytics DataFrame: the categorical ones
+    (see build_analytics_dataframe).
+    """
+    return [
+        col for col in df.columns
+        if isinstance(df[col].dtype, pd.CategoricalDtype)
+    ]
+
+
+def dimension_categories(df: pd.DataFrame) -> Dict[str, List[Any]]:
+    """
+    Categories actually assigned in each dimension column of an
+    analytics DataFrame (those that passed min_support_ratio).
+    """
+    return {col: df[col].cat.categories.tolist() for col in _dimension_columns(df)}
+
+
+def _relation_type(conn: sqlite3.Connection, name: str) -> Optional[str]:
+    row = conn.execute(
+        "SELECT type FROM sqlite_master WHERE name = ? AND type IN ('table', 'view')",
+        (name,),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _drop_relation(conn: sqlite3.Connection, name: str) -> None:
+    kind = _relation_type(conn, name)
+    if kind is not None:
+        conn.execute(f'DROP {kind.upper()} "{name}"')
+
+
+# row count + content hash of every loaded table, read by result_cache
+METADATA_TABLE = "_table_metadata"
+
+
+def dataframe_content_hash(df: pd.DataFrame) -> str:
+    """
+    Hash of the column names and values of df (row order included).
+    """
+    digest = hashlib.sha256(json.dumps([str(c) for c in df.columns]).encode("utf-8"))
+    if len(df):
+        row_hashes = pd.util.hash_pandas_object(df, index=False)
+        digest.update(row_hashes.to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _record_table_fingerprint(
+    conn: sqlite3.Connection,
+    table_name: str,
+    content_hash: str,
+    append: bool,
+) -> None:
+    """
+    Store the row count and content hash of table_name in METADATA_TABLE;
+    after an append/upsert the new hash chains the previous one.
+    """
+    conn.execute(
+        f'CREATE TABLE IF NOT EXISTS "{METADATA_TABLE}" ('
+        "table_name TEXT PRIMARY KEY, row_count INTEGER, "
+        "content_hash TEXT, loaded_at TEXT)"
+    )
+    if append:
+        row = conn.execute(
+            f'SELECT content_hash FROM "{METADATA_TABLE}" WHERE table_name = ?',
+            (table_name,),
+        ).fetchone()
+        if row is not None:
+            content_hash = hashlib.sha256(
+                f"{row[0]}:{content_hash}".encode("utf-8")
+            ).hexdigest()
+
+    row_count = conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+    conn.execute(
+        f'INSERT OR REPLACE INTO "{METADATA_TABLE}" '
+        "(table_name, row_count, content_hash, loaded_at) "
+        "VALUES (?, ?, ?, datetime('now'))",
+        (table_name, row_count, content_hash),
+    )
+
+
+def table_fingerprint(
+    conn: sqlite3.Connection,
+    table_name: str = "observations_enriched",
+) -> Optional[str]:
+    """
+    "<row_count>:<content_hash>" recorded when table_name was loaded,
+    or None if it was not loaded by save_dataframe_to_sqlite /
+    upsert_dataframe_to_sqlite.
+    """
+    if _relation_type(conn, METADATA_TABLE) is None:
+        return None
+    row = conn.execute(
+        f'SELECT row_count, content_hash FROM "{METADATA_TABLE}" WHERE table_name = ?',
+        (table_name,),
+    ).fetchone()
+    return f"{row[0]}:{row[1]}" if row else None
 
-    dim2col = {dim: dim.lower() for dim in dimension_types}
 
-    rows: List[Dict[str, Any]] = []
-    for rec in assignments:
-        row: Dict[str, Any] = {}
+def rollup_columns(
+    df: pd.DataFrame,
+    dimension_cols: Optional[List[str]] = None,
+) -> List[str]:
+    """
+    Columns of the rollup table built for df: dimension columns,
+    event_year / event_month, then ROLLUP_MEASURES.
+    """
+    dims = _dimension_columns(df) if dimension_cols is None else list(dimension_cols)
+    keys = dims + [c for c in TIME_COLUMNS if c in df.columns]
+    return keys + list(ROLLUP_MEASURES)
 
-        if include_raw_index:
-            row["row_id"] = rec.get("row_index")
 
-        obs_date = rec.get("observation_date")
-        proc_date = rec.get("processed_date")
+def build_rollup_table(
+    conn: sqlite3.Connection,
+    group_cols: List[str],
+    table_name: str = "observations_enriched",
+    rollup_name: str = ROLLUP_TABLE,
+) -> None:
+    """
+    (Re)build the rollup of table_name at the grain of group_cols:
+    one row per observed combination, with the number of observations
+    and the sum / count of processing_time_days, so that any coarser
+    COUNT or AVG can be answered by summing rollup rows.
+    """
+    with conn:
+        _create_rollup(conn, group_cols, table_name, rollup_name)
 
-        row["observation_date"] = obs_date
-        row["processed_date"] = proc_date
 
-        for dim_type, col_name in dim2col.items():
-            row[col_name] = None
+def _create_rollup(
+    conn: sqlite3.Connection,
+    group_cols: List[str],
+    table_name: str,
+    rollup_name: str,
+) -> None:
+    # body of build_rollup_table, inside the caller's transaction
+    keys_sql = ", ".join(f'"{c}"' for c in group_cols)
+    select_keys = f"{keys_sql}, " if group_cols else ""
+    group_by = f" GROUP BY {keys_sql}" if group_cols else ""
+    _drop_relation(conn, rollup_name)
+    conn.execute(
+        f'CREATE TABLE "{rollup_name}" AS SELECT {select_keys}'
+        f"COUNT(*) AS n_observations, "
+        f"SUM(processing_time_days) AS sum_processing_time_days, "
+        f"COUNT(processing_time_days) AS count_processing_time_days "
+        f'FROM "{table_name}"{group_by}'
+    )
 
-        assignments_dict = rec.get("assignments", {}) or {}
-        for dim_type, category in assignments_dict.items():
-            col_name = dim2col[dim_type]
-            row[col_name] = category
 
-        rows.append(row)
+class MemoryConnection(sqlite3.Connection):
+    """
+    sqlite3 connection to a named in-memory database; `uri` opens more
+    connections to the same database (e.g. read-only workers).
+    """
+    uri: str = ""
 
-    df = pd.DataFrame(rows)
 
-    df["observation_date"] = pd.to_datetime(df["observation_date"], errors="coerce")
-    df["processed_date"] = pd.to_datetime(df["processed_date"], errors="coerce")
+def open_memory_db(name: str = "observations") -> MemoryConnection:
+    """
+    Connection to a named in-memory database (memdb VFS).
 
-    df["processing_time_days"] = (
-        (df["processed_date"] - df["observation_date"])
-        .dt.total_seconds()
-        .div(86400.0)
+    Other connections opened on conn.uri see the same data as long as
+    one of them stays open, each with its own page cache so they can
+    read concurrently; the connection can be used from other threads.
+    Write it to disk with persist_sqlite.
+    """
+    uri = f"file:/{name}?vfs=memdb"
+    conn = sqlite3.connect(
+        uri, uri=True, check_same_thread=False, factory=MemoryConnection
     )
+    conn.uri = uri
+    return conn
 
-    df["event_year"] = df["observation_date"].dt.year
-    df["event_month"] = df["observation_date"].dt.month
 
-    return df
+def persist_sqlite(conn: sqlite3.Connection, db_path: str | Path) -> None:
+    """
+    Copy a (typically in-memory) database to a file with the backup API.
+    """
+    dest = sqlite3.connect(Path(db_path))
+    try:
+        conn.backup(dest)
+    finally:
+        dest.close()
 
 
 def save_dataframe_to_sqlite(
     df: pd.DataFrame,
-    db_path: str | Path,
+    db_path: str | Path | None,
     table_name: str = "observations_enriched",
     if_exists: str = "replace",
+    dimension_cols: Optional[List[str]] = None,
+    dictionary_encode: bool = False,
+    create_indexes: bool = True,
+    conn: Optional[sqlite3.Connection] = None,
+    rollup_name: Optional[str] = ROLLUP_TABLE,
 ) -> None:
+    """
+    Bulk-load the analytics DataFrame into SQLite.
+
+    The rows are written with a single executemany in one transaction,
+    on a connection tuned with BULK_LOAD_PRAGMAS. Indexes are built
+    after the load (one per dimension column, one on
+    (event_year, event_month) and one per date column), then ANALYZE
+    refreshes the planner statistics.
+
+    dimension_cols : defaults to the categorical columns of df.
+    dictionary_encode : store each dimension as an integer id in
+        "<table_name>_data", with a "<table_name>_<dim>" lookup table
+        (id, name) per dimension; table_name is then a view joining them
+        back, so queries see the same columns. Not meant for tables later
+        updated with upsert_dataframe_to_sqlite.
+    if_exists : "replace", "append" or "fail".
+    conn : load through this open connection (e.g. from open_memory_db)
+        instead of opening db_path; it is left open, with its PRAGMA
+        settings restored.
+    rollup_name : name of the rollup table rebuilt after the load
+        (see build_rollup_table, columns from rollup_columns); None to
+        skip it. Requires a processing_time_days column.
+    """
+    if if_exists not in ("replace", "append", "fail"):
+        raise ValueError(f"Unknown if_exists: {if_exists}")
+
+    dims = _dimension_columns(df) if dimension_cols is None else list(dimension_cols)
+    missing = [c for c in dims if c not in df.columns]
+    if missing:
+        raise ValueError(f"Dimension columns not in the DataFrame: {missing}")
+
+    data_table = f"{table_name}_data" if dictionary_encode else table_name
+
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(Path(db_path))
+    # a caller's connection gets its own settings back after the load
+    previous_pragmas = {} if own_conn else {
+        pragma: conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+        for pragma in BULK_LOAD_PRAGMAS
+    }
+    try:
+        for pragma, value in BULK_LOAD_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+
+        exists = _relation_type(conn, table_name) is not None
+        if exists and if_exists == "fail":
+            raise ValueError(f"Table '{table_name}' already exists.")
+        append = exists and if_exists == "append"
+
+        columns: Dict[str, List[Any]] = {}
+        col_types: Dict[str, str] = {}
+        lookups: Dict[str, List[Any]] = {}
+        for col in df.columns:
+            if dictionary_encode and col in dims:
+                series = df[col]
+                if not isinstance(series.dtype, pd.CategoricalDtype):
+                    series = series.astype("category")
+                lookups[col] = series.cat.categories.tolist()
+                # lookup ids start at 1; code -1 (missing) -> NULL
+                codes = series.cat.codes.to_numpy().astype(np.int64) + 1
+                columns[f"{col}_id"] = np.where(codes > 0, codes, None).tolist()
+                col_types[f"{col}_id"] = "INTEGER"
+            else:
+                columns[col] = _sqlite_column_values(df[col])
+                col_types[col] = _sqlite_type(df[col])
+
+        with conn:
+            if not append:
+                # also the relations of a previous dictionary-encoded load
+                for name in [table_name, f"{table_name}_data"] + [
+                    f"{table_name}_{col}" for col in dims
+                ]:
+                    _drop_relation(conn, name)
+                cols_sql = ", ".join(f'"{c}" {t}' for c, t in col_types.items())
+                conn.execute(f'CREATE TABLE "{data_table}" ({cols_sql})')
+
+            for col, categories in lookups.items():
+                lookup_table = f"{table_name}_{col}"
+                if not append:
+                    conn.execute(
+                        f'CREATE TABLE "{lookup_table}" '
+                        f"(id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)"
+                    )
+                conn.executemany(
+                    f'INSERT OR IGNORE INTO "{lookup_table}" (name) VALUES (?)',
+                    [(name,) for name in categories],
+                )
+                # map the DataFrame codes onto the ids of the lookup table
+                name2id = dict(
+                    conn.execute(f'SELECT name, id FROM "{lookup_table}"').fetchall()
+                )
+                remap = np.array(
+                    [None] + [name2id[name] for name in categories], dtype=object
+                )
+                codes = np.array(
+                    [c or 0 for c in columns[f"{col}_id"]], dtype=np.int64
+                )
+                columns[f"{col}_id"] = remap[codes].tolist()
+
+            if lookups and not append:
+                select = []
+                joins = []
+                for col in df.columns:
+                    if col in lookups:
+                        alias = f"l{len(joins)}"
+                        select.append(f'{alias}.name AS "{col}"')
+                        joins.append(
+                            f'LEFT JOIN "{table_name}_{col}" AS {alias} '
+                            f'ON {alias}.id = d."{col}_id"'
+                        )
+                    else:
+                        select.append(f'd."{col}"')
+                conn.execute(
+                    f'CREATE VIEW "{table_name}" AS SELECT {", ".join(select)} '
+                    f'FROM "{data_table}" AS d {" ".join(joins)}'
+                )
+
+            names = list(columns.keys())
+            cols_sql = ", ".join(f'"{c}"' for c in names)
+            placeholders = ", ".join("?" for _ in names)
+            conn.executemany(
+                f'INSERT INTO "{data_table}" ({cols_sql}) VALUES ({placeholders})',
+                zip(*columns.values()),
+            )
+            _record_table_fingerprint(
+                conn, table_name, dataframe_content_hash(df), append
+            )
+
+        if rollup_name is not None and "processing_time_days" in df.columns:
+            group_cols = rollup_columns(df, dims)[: -len(ROLLUP_MEASURES)]
+            build_rollup_table(conn, group_cols, table_name, rollup_name)
+
+        if create_indexes:
+            index_sets = [[f"{c}_id" if c in lookups else c] for c in dims]
+            if "event_year" in df.columns and "event_month" in df.columns:
+                index_sets.append(["event_year", "event_month"])
+            index_sets.extend([c] for c in DATE_COLUMNS if c in df.columns)
+
+            with conn:
+                for cols in index_sets:
+                    index_name = f"ix_{data_table}_{'_'.join(cols)}"
+                    cols_sql = ", ".join(f'"{c}"' for c in cols)
+                    conn.execute(
+                        f'CREATE INDEX IF NOT EXISTS "{index_name}" '
+                        f'ON "{data_table}" ({cols_sql})'
+                    )
+                conn.execute("ANALYZE")
+    finally:
+        for pragma, value in previous_pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        if own_conn:
+            conn.close()
+
+
+def upsert_dataframe_to_sqlite(
+    df: pd.DataFrame,
+    db_path: str | Path,
+    key_col: str = "observation_id",
+    table_name: str = "observations_enriched",
+    rollup_name: Optional[str] = ROLLUP_TABLE,
+) -> None:
+    """
+    Insert new rows and update existing ones (matched on key_col) instead
+    of replacing the whole table. Columns missing on either side are
+    added to the table / filled with NULL. An existing table must have
+    key_col on every row (ValueError otherwise).
+
+    rollup_name : the rollup table is rebuilt in the same transaction, at
+        the grain it already had (or the one of df if there was none), so
+        aggregate queries never read stale counts; if it cannot be
+        rebuilt (e.g. no processing_time_days) it is dropped and queries
+        fall back to table_name. None leaves it alone.
+    """
+    if key_col not in df.columns:
+        raise ValueError(f"Column '{key_col}' is required for upserts.")
 
     db_path = Path(db_path)
     conn = sqlite3.connect(db_path)
     try:
-        df.to_sql(table_name, conn, if_exists=if_exists, index=False)
+        existing = [
+            r[1] for r in conn.execute(f'PRAGMA table_info("{table_name}")')
+        ]
+        if not existing:
+            df.head(0).to_sql(table_name, conn, index=False)
+            existing = df.columns.tolist()
+        elif key_col not in existing or conn.execute(
+            f'SELECT 1 FROM "{table_name}" WHERE "{key_col}" IS NULL LIMIT 1'
+        ).fetchone():
+            # NULL keys never conflict: every row would be inserted again
+            raise ValueError(
+                f"Table '{table_name}' has rows without '{key_col}': reload it "
+                f"with save_dataframe_to_sqlite before upserting."
+            )
+        else:
+            for col in df.columns:
+                if col not in existing:
+                    conn.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{col}"')
+                    existing.append(col)
+
+        conn.execute(
+            f'CREATE UNIQUE INDEX IF NOT EXISTS "ux_{table_name}_{key_col}" '
+            f'ON "{table_name}" ("{key_col}")'
+        )
+
+        # grain of the rollup: the current one, else the one of a fresh load
+        group_cols = [
+            r[1] for r in conn.execute(f'PRAGMA table_info("{rollup_name}")')
+            if r[1] not in ROLLUP_MEASURES
+        ] if rollup_name is not None else []
+        if rollup_name is not None and not group_cols:
+            group_cols = rollup_columns(df)[: -len(ROLLUP_MEASURES)]
+
+        df = df.reindex(columns=existing)
+        cols_sql = ", ".join(f'"{c}"' for c in existing)
+        placeholders = ", ".join("?" for _ in existing)
+        updates = ", ".join(
+            f'"{c}" = excluded."{c}"' for c in existing if c != key_col
+        )
+        on_conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+        sql = (
+            f'INSERT INTO "{table_name}" ({cols_sql}) VALUES ({placeholders}) '
+            f'ON CONFLICT("{key_col}") {on_conflict}'
+        )
+        with conn:
+            conn.executemany(sql, _to_sqlite_values(df))
+            _record_table_fingerprint(
+                conn, table_name, dataframe_content_hash(df), append=True
+            )
+            if rollup_name is not None:
+                _refresh_rollup(conn, group_cols, table_name, rollup_name)
     finally:
         conn.close()
 
 
+def _refresh_rollup(
+    conn: sqlite3.Connection,
+    group_cols: List[str],
+    table_name: str,
+    rollup_name: str,
+) -> None:
+    """
+    Rebuild rollup_name inside the caller's transaction, or drop it when
+    the grain no longer matches table_name.
+    """
+    try:
+        _create_rollup(conn, group_cols, table_name, rollup_name)
+    except sqlite3.Error as exc:
+        print(f"⚠️ Rollup '{rollup_name}' not rebuilt ({exc}): dropped.")
+        _drop_relation(conn, rollup_name)
+
+
 def save_dataframe_to_csv(
     df: pd.DataFrame,
     csv_path: str | Path
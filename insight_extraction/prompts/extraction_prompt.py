@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 import json
 
 
@@ -20,7 +20,71 @@ def _summarize_categories_from_intent(json_spec: Dict[str, Any]) -> str:
     return "\n".join(lines) if lines else "No explicit categories."
 
 
+def _describe_rollup_table(
+    rollup_table: Optional[str],
+    rollup_schema: Optional[List[str]],
+    main_table: str,
+) -> str:
+    """
+    Prompt section presenting the pre-aggregated rollup table.
+    """
+    if not rollup_table or not rollup_schema:
+        return ""
+
+    keys = [c for c in rollup_schema if c not in (
+        "n_observations", "sum_processing_time_days", "count_processing_time_days",
+    )]
+    return f"""
+ROLLUP TABLE (pre-aggregated, PREFER IT for counts and averages):
+- {rollup_table}: one row per combination of {', '.join(keys)}.
+- Columns: {', '.join(rollup_schema)}.
+- Number of observations: SUM(n_observations) instead of COUNT(*).
+- Average processing time:
+  SUM(sum_processing_time_days) * 1.0 / SUM(count_processing_time_days)
+  instead of AVG(processing_time_days).
+- Filter and group on {', '.join(keys)} as you would on {main_table}.
+- Use {main_table} only when a query needs other columns (row_id, dates...).
+"""
+
+
+def build_repair_prompt(
+    sql: str,
+    error_message: str,
+    schema_text: str,
+    main_table: str,
+    sql_dialect: str = "SQLite",
+) -> str:
+    """
+    Prompt asking the LLM to fix ONE query that failed validation,
+    given the database error and the real schema.
+    """
+    prompt = f"""
+You are an SQL repair assistant.
 
+The following {sql_dialect} query failed validation against the database.
+
+QUERY:
+{sql}
+
+ERROR:
+{error_message}
+
+DATABASE SCHEMA (tables and their columns):
+{schema_text}
+
+Your task:
+- Fix the query so that it runs on this schema and keeps its original intent.
+- Main table: {main_table}.
+- Use ONLY tables and columns listed in the schema.
+- The result MUST be a single SELECT statement (a WITH ... SELECT is allowed).
+- No DDL / no updates / no deletes.
+
+OUTPUT FORMAT (MANDATORY):
+- Output ONLY the corrected SQL query.
+- Do NOT add labels, comments, explanations or markdown backticks.
+    """.strip()
+
+    return prompt
 
 
 def build_extraction_prompt(
@@ -30,6 +94,8 @@ def build_extraction_prompt(
     main_table: str,
     sql_dialect: str = "SQLite",
     schema_text: Optional[Any] = None,
+    rollup_table: Optional[str] = None,
+    rollup_schema: Optional[List[str]] = None,
 ) -> str:
     """
     Prompt for SQL generation, consistent with the existing parser
@@ -45,6 +111,7 @@ def build_extraction_prompt(
     """
 
     categories_summary = _summarize_categories_from_intent(json_spec)
+    rollup_summary = _describe_rollup_table(rollup_table, rollup_schema, main_table)
 
 
 
@@ -103,6 +170,7 @@ CATEGORIES (from intent.group_by):
 {categories_summary}
 SCHEMA COLUMNS THAT YOU MUST FOLLOW FOR GENERATING QUERIES:
 {', '.join(schema_text) if schema_text else 'No schema information provided.'}
+{rollup_summary}
 
 
 
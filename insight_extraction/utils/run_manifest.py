@@ -0,0 +1,136 @@
+from __future__ import annotations
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import json
+import threading
+import uuid
+
+MANIFEST_NAME = "manifest.json"
+
+
+def new_run_id() -> str:
+    """
+    Unique run id: timestamp plus a random suffix, so runs started in
+    the same second never share a directory.
+    """
+    return f"{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:6]}"
+
+
+@dataclass
+class Artifact:
+    kind: str
+    name: str
+    path: str            # relative to the run directory
+    created_at: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+class RunManifest:
+    """
+    Artifacts produced by one run, all stored under run_dir
+    (<base_dir>/runs/<run_id>/<kind>/...) and listed in
+    run_dir/manifest.json.
+
+    Downstream stages iterate artifacts(kind) instead of listing shared
+    folders, so files of other (older or concurrent) runs are never
+    picked up. The manifest is rewritten on every add, from any thread.
+    """
+
+    def __init__(self, run_id: str, run_dir: str | Path) -> None:
+        self.run_id = str(run_id)
+        self.run_dir = Path(run_dir)
+        self.created_at = datetime.now().isoformat(timespec="seconds")
+        self.entries: List[Artifact] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, base_dir: str | Path, run_id: Optional[str] = None) -> "RunManifest":
+        """
+        New manifest in <base_dir>/runs/<run_id> (new_run_id() when None).
+        A run id used before starts from an empty manifest: its old files
+        are no longer listed.
+        """
+        run_id = run_id if run_id is not None else new_run_id()
+        manifest = cls(run_id, Path(base_dir) / "runs" / str(run_id))
+        manifest.run_dir.mkdir(parents=True, exist_ok=True)
+        manifest.save()
+        return manifest
+
+    @classmethod
+    def load(cls, run_dir: str | Path) -> "RunManifest":
+        run_dir = Path(run_dir)
+        with (run_dir / MANIFEST_NAME).open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        manifest = cls(data["run_id"], run_dir)
+        manifest.created_at = data["created_at"]
+        manifest.entries = [Artifact(**a) for a in data["artifacts"]]
+        return manifest
+
+    def dir(self, kind: str) -> Path:
+        """
+        Directory of the artifacts of one kind (created if missing).
+        """
+        path = self.run_dir / kind
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def path(self, kind: str, filename: str) -> Path:
+        return self.dir(kind) / filename
+
+    def add(
+        self,
+        kind: str,
+        name: str,
+        path: str | Path,
+        **metadata: Any,
+    ) -> Artifact:
+        """
+        Record an artifact (replacing one with the same kind and name)
+        and rewrite the manifest.
+        """
+        path = Path(path)
+        try:
+            path = path.resolve().relative_to(self.run_dir.resolve())
+        except ValueError:
+            # outside the run directory (e.g. a shared cache): kept as given
+            pass
+        artifact = Artifact(
+            kind=kind,
+            name=name,
+            path=path.as_posix(),
+            created_at=datetime.now().isoformat(timespec="seconds"),
+            metadata=metadata,
+        )
+        with self._lock:
+            self.entries = [
+                a for a in self.entries if (a.kind, a.name) != (kind, name)
+            ] + [artifact]
+            self._save_locked()
+        return artifact
+
+    def artifacts(self, kind: Optional[str] = None) -> List[Artifact]:
+        with self._lock:
+            return [a for a in self.entries if kind is None or a.kind == kind]
+
+    def resolve(self, artifact: Artifact) -> Path:
+        return self.run_dir / artifact.path
+
+    def save(self) -> Path:
+        with self._lock:
+            return self._save_locked()
+
+    def _save_locked(self) -> Path:
+        manifest_path = self.run_dir / MANIFEST_NAME
+        tmp_path = manifest_path.with_suffix(".json.tmp")
+        data = {
+            "run_id": self.run_id,
+            "created_at": self.created_at,
+            "artifacts": [asdict(a) for a in self.entries],
+        }
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        # readers never see a half-written manifest
+        tmp_path.replace(manifest_path)
+        return manifest_path
@@ -1,7 +1,10 @@
 import json
+import threading
 from pathlib import Path
 import pandas as pd
-from typing import Dict, Any
+from typing import Dict, Any, List
+
+RESULT_FORMATS = ("csv", "parquet")
 
 def save_intent_to_file(intent: dict, output_path: str) -> None:
     """
@@ -26,47 +29,101 @@ def load_test_intent(path: str) -> dict:
         return json.load(f)
 
 
-def save_sql_results_to_csv(
+class InsightFrames(dict):
+    """
+    Result DataFrames by (safe) query key, as returned by
+    save_sql_results; paths maps each key to its file and pending_writes
+    holds the background writes of those files (see wait_for_persistence).
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.paths: Dict[str, Path] = {}
+        self.pending_writes: List[threading.Thread] = []
+
+    def wait_for_persistence(self) -> None:
+        """
+        Block until the background writes of the result files end.
+        """
+        for thread in self.pending_writes:
+            thread.join()
+        self.pending_writes.clear()
+
+
+def _write_result_frames(frames: Dict[str, pd.DataFrame], paths: Dict[str, Path]) -> None:
+    for key, df in frames.items():
+        out_path = paths[key]
+        if out_path.suffix == ".parquet":
+            df.to_parquet(out_path, index=False)
+        else:
+            df.to_csv(out_path, index=False, encoding="utf-8")
+        print(f"[✓] Saved: {out_path}")
+
+
+def save_sql_results(
     results: Dict[str, Dict[str, Any]],
     output_dir: str | Path,
-) -> Dict[str, "pd.DataFrame"]:
+    fmt: str = "csv",
+    async_save: bool = False,
+) -> InsightFrames:
     """
-    Save every SQL generated (ottenuto da execute_sql_on_sqlite) 
-    as a separate CSV file in the given folder.
+    Save every SQL result (from execute_sql_on_sqlite) as a separate
+    file of the given format ("csv" or "parquet") in output_dir and
+    return the result frames by safe key, for the downstream stages to
+    use without reading the files back.
 
-    Parameters:
-      - results: dict created by execute_sql_on_sqlite(...)
-      - output_dir: output folder (default: aggregate_dataset)
-    Output:
-      - Creates files like:
-        _output_dir_/main_query.csv
-        _output_dir_/extra_insight_query_1.csv
-        ...
+    With async_save the files are written in a background (non-daemon)
+    thread and the frames are returned right away.
     """
+    if fmt not in RESULT_FORMATS:
+        raise ValueError(f"Unknown result format: {fmt}")
 
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    dfs: Dict[str, pd.DataFrame] = {}
+    dfs = InsightFrames()
+    paths = dfs.paths
 
     for key, payload in results.items():
-        cols = payload["columns"]
-        rows = payload["rows"]
-
-        df = pd.DataFrame(rows, columns=cols)
-
         # Safe filename (no spaces or odd characters)
         safe_key = key.replace(" ", "_").replace("/", "_").split(":")[0]
         print(f"{safe_key} table created...")
 
-        out_path = output_dir / f"{safe_key}.csv"
-        df.to_csv(out_path, index=False, encoding="utf-8")
-
-        dfs[safe_key] = df
+        dfs[safe_key] = payload["frame"]
+        paths[safe_key] = output_dir / f"{safe_key}.{fmt}"
 
-        print(f"[✓] Saved: {out_path}")
+    if async_save:
+        thread = threading.Thread(
+            target=_write_result_frames,
+            args=(dict(dfs), dict(paths)),
+            name=f"save-sql-results-{output_dir}",
+        )
+        thread.start()
+        dfs.pending_writes.append(thread)
+    else:
+        _write_result_frames(dfs, paths)
 
     return dfs
+
+
+def save_sql_results_to_csv(
+    results: Dict[str, Dict[str, Any]],
+    output_dir: str | Path,
+) -> Dict[str, "pd.DataFrame"]:
+    """
+    Save every SQL generated (ottenuto da execute_sql_on_sqlite) 
+    as a separate CSV file in the given folder.
+
+    Parameters:
+      - results: dict created by execute_sql_on_sqlite(...)
+      - output_dir: output folder (default: aggregate_dataset)
+    Output:
+      - Creates files like:
+        _output_dir_/main_query.csv
+        _output_dir_/extra_insight_query_1.csv
+        ...
+    """
+    return save_sql_results(results, output_dir, fmt="csv")
     
 
 
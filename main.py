@@ -4,6 +4,7 @@ from datetime import datetime
 import json
 from pathlib import Path
 import time
+from typing import Optional
 import pandas as pd
 
 from insight_extraction.categorizer.categorize import run_pipeline
@@ -13,21 +14,42 @@ from insight_extraction.semantic_intent.expander import (
 )
 from models.llm_client import OpenAILLMClient
 from insight_extraction.utils.saving_scripts import save_intent_to_file
+from insight_extraction.utils.run_manifest import RunManifest
 from insight_extraction.extraction.extract import define_queries, extract_insights
+from insight_extraction.extraction.table_creator import open_memory_db
+from insight_extraction.extraction.result_cache import ResultCache
+from insight_extraction.extraction.sql_generate import SQLQueryGenerator
+from insight_extraction.extraction.preview import start_refinement
 from from_text_to_streamlit_app.prompts.text_to_json_prompt import get_text_to_json_prompt
-from from_text_to_streamlit_app.utils import clean_response, from_csv_to_dict, json_to_streamlit
+from from_text_to_streamlit_app.utils import clean_response, json_to_streamlit
 from viz_recommender.services.chart_recommender import build_full_prompt, generate_chart_recommendation
 from viz_recommender.services.file_io import save_text_file
-from viz_recommender.services.lida_service import create_lida_manager, load_dataframe, summarize_dataframe
+from viz_recommender.services.lida_service import create_lida_manager, summarize_dataframe
 from viz_recommender.services.prompt_loader import load_text_file
 
 DATA_DIR = Path("datasets")
 OUT_DIR = Path("output")
 USR_PROMPT_DIR = Path("initial_prompts")
-RECOMMENDATION_DIR = Path("chart_recommendation")
-
-
-def main(user_prompt: str, df: pd.DataFrame, run_id: str) -> None:
+# "sqlite" or "duckdb" (in-process columnar engine, needs pip install duckdb)
+SQL_BACKEND = "sqlite"
+SQL_DIALECTS = {"sqlite": "SQLite", "duckdb": "DuckDB"}
+# preview mode: categorize this fraction of the rows (stratified by month)
+# and report scaled counts with confidence intervals; None = all rows
+PREVIEW_FRACTION: Optional[float] = None
+# after a preview, rerun the same queries on all rows in the background
+REFINE_PREVIEW = True
+# embed only the rows inside the intent time window / raw-column filters
+# (faster, but categories are selected on those rows only)
+PUSHDOWN = False
+
+
+def main(user_prompt: str, df: pd.DataFrame, run_id: Optional[str] = None) -> None:
+
+    # every artifact of this run goes to OUT_DIR/runs/<run_id>, listed in
+    # its manifest.json (run_id None -> a new unique id)
+    manifest = RunManifest.create(OUT_DIR, run_id)
+    run_id = manifest.run_id
+    print(f">>> Run {run_id}: artifacts in {manifest.run_dir}\n")
     
     # Real OpenAI client (assumes OPENAI_API_KEY in the environment)
     llm_client = OpenAILLMClient(
@@ -52,11 +74,9 @@ def main(user_prompt: str, df: pd.DataFrame, run_id: str) -> None:
     print(">>> Parsed intent JSON:")
     print(json.dumps(intent, indent=2, ensure_ascii=False))
 
-    INTENT_DIR = OUT_DIR / "intents"
-    os.makedirs(INTENT_DIR, exist_ok=True)
-
-    intent_path = INTENT_DIR / f"intent_{run_id}.json"
+    intent_path = manifest.path("intents", "intent.json")
     save_intent_to_file(intent, str(intent_path))
+    manifest.add("intent", "intent", intent_path)
 
     print(f"\n>>> JSON salvato in: {intent_path}")
 
@@ -65,9 +85,6 @@ def main(user_prompt: str, df: pd.DataFrame, run_id: str) -> None:
     # ------------------------------------------------------------------
     print("\n>>>>>>>>> -------- Categories expansion ------- <<<<<<<<<\n")
 
-    EXPANSIONS_DIR = OUT_DIR / "expansions"
-    os.makedirs(EXPANSIONS_DIR, exist_ok=True)
-
     all_expansions: dict[str, dict[str, any]] = {}
 
     for group in intent.get("group_by", []):
@@ -91,16 +108,18 @@ def main(user_prompt: str, df: pd.DataFrame, run_id: str) -> None:
 
         all_expansions[dim_type] = expanded
 
-        exp_path = EXPANSIONS_DIR / f"expansion_{dim_type}_{run_id}.json"
+        exp_path = manifest.path("expansions", f"expansion_{dim_type}.json")
         with exp_path.open("w", encoding="utf-8") as f:
             json.dump(expanded, f, indent=2, ensure_ascii=False)
+        manifest.add("expansion", dim_type, exp_path)
 
         print(f"Saved expansion for {dim_type} to: {exp_path}\n")
 
     # single file with all expansions (used by the pipeline)
-    expansions_all_path = EXPANSIONS_DIR / f"expansions_all_{run_id}.json"
+    expansions_all_path = manifest.path("expansions", "expansions_all.json")
     with expansions_all_path.open("w", encoding="utf-8") as f:
         json.dump(all_expansions, f, indent=2, ensure_ascii=False)
+    manifest.add("expansion", "all", expansions_all_path)
 
     print(f">>> All expansions saved to: {expansions_all_path}\n")
 
@@ -110,76 +129,142 @@ def main(user_prompt: str, df: pd.DataFrame, run_id: str) -> None:
     print("\n>>>>>>>>> -------- Categorization ------- <<<<<<<<<\n")
     print("Run categorization pipeline...\n")
 
-    allocation_path = OUT_DIR / f"allocation_{run_id}.json"
+    allocation_path = manifest.path("allocation", "allocation.parquet")
 
-    run_pipeline(
-        df=df,
+    pipeline_kwargs = dict(
         intent_path=intent_path,
-        output_path=allocation_path,
         model_name="all-MiniLM-L6-v2",
         expansions_path=expansions_all_path,
         similarity_threshold=0.2,
         min_support_ratio=0.01,
+        async_save=True,
+        pushdown=PUSHDOWN,
+    )
+    allocation = run_pipeline(
+        df=df,
+        output_path=allocation_path,
+        sample_fraction=PREVIEW_FRACTION,
+        **pipeline_kwargs,
     )
 
-    print(f">>> Saved file with categories allocations to: {allocation_path}\n")
-
-    # ------------------------------------------------------------------
-    # 5. Insights extraction (SQL)
-    # ------------------------------------------------------------------
-    print("\n>>>>>>>>> -------- Insights extraction ------- <<<<<<<<<\n")
-
-    DB_DIR = OUT_DIR / "db"
-    DB_DIR.mkdir(parents=True, exist_ok=True)
-
-    CSV_DIR = OUT_DIR / "csv"
-    CSV_DIR.mkdir(parents=True, exist_ok=True)
+    print(f">>> Saving file with categories allocations to: {allocation_path}\n")
+
+    insights_dfs = None
+    # the allocation and the insight files are written in background: both
+    # writes finish (and the allocation is listed) even if a later stage fails
+    try:
+        # ------------------------------------------------------------------
+        # 5. Insights extraction (SQL)
+        # ------------------------------------------------------------------
+        print("\n>>>>>>>>> -------- Insights extraction ------- <<<<<<<<<\n")
+
+        # the DuckDB backend reads the analytics table from this Parquet copy
+        analytics_path = (
+            manifest.path("analytics", "observations_enriched.parquet")
+            if SQL_BACKEND == "duckdb" else None
+        )
 
-    db_path = DB_DIR / f"raw_insights_{run_id}.db"
-    csv_path = CSV_DIR / f"raw_insights_{run_id}.csv"
+        # results of queries already run on the same data are reused
+        query_cache = ResultCache(OUT_DIR / "cache" / "query_results.db")
+        conn = None
+        # both are closed even when the LLM or a query fails
+        try:
+            # one in-memory database shared by SQL generation and execution
+            # (pass db_path / csv_path to define_queries to also keep a copy on disk);
+            # the DuckDB backend loads its own copy and needs none
+            if SQL_BACKEND == "sqlite":
+                conn = open_memory_db(f"raw_insights_{run_id}")
+
+            print(">>> Define and run queries to extract insights...\n")
+            sql_code = define_queries(
+                llm_client=llm_client,
+                allocation_path=allocation_path,
+                user_prompt=user_prompt,
+                intent=intent,
+                db_path=None,
+                allocation=allocation,
+                conn=conn,
+                parquet_path=analytics_path,
+                sql_dialect=SQL_DIALECTS[SQL_BACKEND],
+                backend=SQL_BACKEND,
+            )
 
-    print(">>> Define and run queries to extract insights...\n")
-    sql_code = define_queries(
-        llm_client=llm_client,
-        allocation_path=allocation_path,
-        user_prompt=user_prompt,
-        intent=intent,
-        db_path=str(db_path),
-        csv_path=str(csv_path),
-    )
+            insights_dfs = extract_insights(
+                db_path=None,
+                sql_code=sql_code,
+                output_dir=str(manifest.dir("insights")),
+                conn=conn,
+                cache=query_cache,
+                profile_path=str(manifest.path("profiles", "query_profile.json")),
+                # invalid blocks are sent back to the LLM with the database error
+                generator=SQLQueryGenerator(llm_client=llm_client, sql_dialect=SQL_DIALECTS[SQL_BACKEND]),
+                backend=SQL_BACKEND,
+                duckdb_source=analytics_path,
+                # the frames are used in memory below, the CSVs are written meanwhile
+                async_save=True,
+                # preview: population estimates with confidence intervals
+                sample_design=allocation.sample_design,
+            )
+        finally:
+            query_cache.close()
+            if conn is not None:
+                conn.close()
+
+        if analytics_path is not None:
+            manifest.add("analytics", "observations_enriched", analytics_path)
+        manifest.add("profile", "query_profile", manifest.path("profiles", "query_profile.json"))
+        for insight_name, insight_path in insights_dfs.paths.items():
+            manifest.add(
+                "insight", insight_name, insight_path, rows=len(insights_dfs[insight_name]),
+                preview=allocation.sample_design is not None,
+            )
 
-    INSIGHTS_DIR = DATA_DIR / "extracted"
-    INSIGHTS_DIR.mkdir(parents=True, exist_ok=True)
+        if allocation.sample_design is not None and REFINE_PREVIEW:
+            print(">>> Refining the preview on all rows in background...\n")
+            refinement = start_refinement(
+                df,
+                sql_code,
+                str(manifest.dir("insights_full")),
+                pipeline_kwargs={
+                    **pipeline_kwargs,
+                    "output_path": manifest.path("allocation", "allocation_full.parquet"),
+                },
+                db_name=f"raw_insights_{run_id}_full",
+            )
 
-    insights_dfs = extract_insights(
-        db_path=str(db_path),
-        sql_code=sql_code,
-        output_dir=str(INSIGHTS_DIR),
-    )
+            def register_refined(future) -> None:
+                # errors raised in a done-callback are otherwise swallowed
+                try:
+                    frames = future.result()
+                except Exception as exc:
+                    print(f"⚠️ Full-data refinement failed: {exc}")
+                    return
+                for name, path in frames.paths.items():
+                    manifest.add("insight_full", name, path)
+                print(f">>> Full-data insights ready in: {manifest.dir('insights_full')}\n")
 
-    print(f">>> {len(insights_dfs)} tables generated\n\n")
-    insights_name = list(insights_dfs.keys())
+            refinement.add_done_callback(register_refined)
 
-    # ------------------------------------------------------------------
-    # 6. Chart recommendation
-    # ------------------------------------------------------------------
-    print(">>>>>>>>>>>> -------- Recommending chart ------- <<<<<<<<<\n")
+        print(f">>> {len(insights_dfs)} tables generated\n\n")
 
-    system_prompt = load_text_file("viz_recommender/prompts/viz_prompt.txt")
+        # ------------------------------------------------------------------
+        # 6. Chart recommendation
+        # ------------------------------------------------------------------
+        print(">>>>>>>>>>>> -------- Recommending chart ------- <<<<<<<<<\n")
 
-    api_key = os.getenv("OPENAI_API_KEY")
-    if api_key is None:
-        raise ValueError("OPENAI_API_KEY environment variable not found.")
+        system_prompt = load_text_file("viz_recommender/prompts/viz_prompt.txt")
 
-    lida_manager = create_lida_manager(api_key=api_key)
+        api_key = os.getenv("OPENAI_API_KEY")
+        if api_key is None:
+            raise ValueError("OPENAI_API_KEY environment variable not found.")
 
-    os.makedirs(RECOMMENDATION_DIR, exist_ok=True)
-    for df_n, file in enumerate(os.listdir(INSIGHTS_DIR)):
-        if file.endswith(".csv"):
-            csv_path = INSIGHTS_DIR / file
+        lida_manager = create_lida_manager(api_key=api_key)
 
-            print(f">>> Generating data profile with LIDA for {file.split('.')[0]} ...")
-            df = load_dataframe(str(csv_path))
+        # only the insights of this run (manifest), frames taken from memory
+        for artifact in manifest.artifacts("insight"):
+            insight_name = artifact.name
+            df = insights_dfs[insight_name]
+            print(f">>> Generating data profile with LIDA for {insight_name} ...")
             data_profile_str = summarize_dataframe(df, lida_manager, summary_method="detailed")
 
             full_prompt = build_full_prompt(
@@ -188,25 +273,37 @@ def main(user_prompt: str, df: pd.DataFrame, run_id: str) -> None:
                 system_prompt=system_prompt,
             )
 
-            print(f">>> Analyzing {insights_name[df_n]} with LLM...\n")
+            print(f">>> Analyzing {insight_name} with LLM...\n")
             recommend_survey = generate_chart_recommendation(llm_client, full_prompt)
 
-            recommendation_path = Path(RECOMMENDATION_DIR) / f"{insights_name[df_n]}.txt"
+            recommendation_path = manifest.path("recommendations", f"{insight_name}.txt")
             save_text_file(recommend_survey, recommendation_path)
-        else:
-            print(f"⚠️⚠️⚠️ Skipping non-CSV file: {file} ⚠️⚠️⚠️\n")
-            continue
-        
-    print("\n>>>>>>>>> -------- Generating Streamlit app ------- <<<<<<<<<\n")
-    datasets = from_csv_to_dict()
-    prompt = get_text_to_json_prompt(datasets, RECOMMENDATION_DIR)
-    response = llm_client.invoke(prompt)
-    print(response)
-
-    cleaned_response = clean_response(response)
+            manifest.add("recommendation", insight_name, recommendation_path)
+
+        print("\n>>>>>>>>> -------- Generating Streamlit app ------- <<<<<<<<<\n")
+        datasets = {a.name: insights_dfs[a.name] for a in manifest.artifacts("insight")}
+        prompt = get_text_to_json_prompt(
+            datasets,
+            manifest.dir("recommendations"),
+            rec_paths=[manifest.resolve(a) for a in manifest.artifacts("recommendation")],
+        )
+        response = llm_client.invoke(prompt)
+        print(response)
+
+        cleaned_response = clean_response(response)
     
-    workflow = json.loads(cleaned_response)
-    json_to_streamlit(workflow, data_sources=datasets)
+        workflow = json.loads(cleaned_response)
+        workflow_path = manifest.path("dashboard", "workflow.json")
+        with workflow_path.open("w", encoding="utf-8") as f:
+            json.dump(workflow, f, indent=2, ensure_ascii=False)
+        manifest.add("dashboard", "workflow", workflow_path)
+        json_to_streamlit(workflow, data_sources=datasets)
+    finally:
+        allocation.wait_for_persistence()
+        if allocation_path.exists():
+            manifest.add("allocation", "allocation", allocation_path)
+        if insights_dfs is not None:
+            insights_dfs.wait_for_persistence()
 
 
 if __name__ == "__main__":